@@ -0,0 +1,88 @@
+"""
+In-process latency of a cached redirect, full FastAPI stack versus
+FastRedirectMiddleware.
+
+Both are called as plain ASGI apps with a short code that is already in
+the redirect cache, so no database is needed and the numbers are the
+framework overhead alone. Run it with LINK_FAST_REDIRECT unset, so that
+the "fastapi" column really goes through the full stack.
+
+    python -m benchmarks.redirect_asgi [--requests 20000]
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.main import app
+from src.link.services.link_service import redirect_cache
+from src.link.routers.fast_redirect import FastRedirectMiddleware
+
+CODE = "bench01"
+
+
+def make_scope() -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"/l/{CODE}",
+        "raw_path": f"/l/{CODE}".encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8005),
+    }
+
+
+async def call(asgi) -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asgi(make_scope(), receive, send)
+    return status
+
+
+async def measure(asgi, requests: int) -> list:
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        status = await call(asgi)
+        timings.append(time.perf_counter() - start)
+        assert status == 307, status
+    return sorted(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    redirect_cache.set(CODE, ("https://example.com/landing", 307))
+    fast = FastRedirectMiddleware(app)
+
+    print(f"{'stack':>8} {'p50 us':>8} {'p99 us':>8} {'mean us':>8}")
+    for name, asgi in (("fastapi", app), ("asgi", fast)):
+        await measure(asgi, 500)
+        timings = await measure(asgi, args.requests)
+        print(
+            f"{name:>8} {timings[len(timings) // 2] * 1e6:>8.1f} "
+            f"{timings[int(len(timings) * 0.99)] * 1e6:>8.1f} {statistics.mean(timings) * 1e6:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
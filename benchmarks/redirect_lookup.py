@@ -0,0 +1,111 @@
+"""
+Short code lookup for redirects, ORM path versus the raw prepared statement.
+
+"orm" is LinkRepository.get_by_code: a compiled select loading a full
+LinkModel into the session. "raw" is LinkRepository.get_redirect: an asyncpg
+prepared statement returning a RedirectRecord. Each lookup uses a fresh
+session, as a request does. Needs the database from .env; the benchmark
+links are inserted with a "bench-" prefix and deleted afterwards.
+
+    python -m benchmarks.redirect_lookup [--links 1000] [--lookups 20000]
+"""
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import tracemalloc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import delete
+
+from src.db.models import LinkModel, init_db
+from src.db.sql_alchemy import Database
+from src.link.utils.redirect import derived_link_values
+from src.link.repositories.link_repository import LinkRepository
+
+PREFIX = "bench-"
+
+database = Database()
+repository = LinkRepository()
+
+
+async def orm(code: str):
+    async with database.SessionLocal() as db:
+        link = await repository.get_by_code(db, code)
+        return link.destination_url, link.redirect_status
+
+
+async def raw(code: str):
+    async with database.SessionLocal() as db:
+        link = await repository.get_redirect(db, code)
+        return link.destination_url, link.redirect_status
+
+
+async def latency(fn, codes) -> list:
+    timings = []
+    for code in codes:
+        start = time.perf_counter()
+        await fn(code)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def allocations(fn, codes) -> tuple:
+    """Peak bytes traced during one lookup and blocks still alive after it, averaged."""
+    peaks, blocks = [], []
+    tracemalloc.start()
+    for code in codes:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        current = tracemalloc.get_traced_memory()[0]
+        await fn(code)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot()
+        blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "filename")))
+    tracemalloc.stop()
+    return statistics.mean(peaks), statistics.mean(blocks)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    await init_db()
+    codes = [f"{PREFIX}{i}" for i in range(args.links)]
+    async with database.SessionLocal() as db:
+        await repository.create_many(db, [
+            {"original_url": f"https://example.com/{i}", "short_code": code, **derived_link_values(f"https://example.com/{i}")}
+            for i, code in enumerate(codes)
+        ])
+        await db.commit()
+
+    try:
+        rnd = random.Random(42)
+        sample = [rnd.choice(codes) for _ in range(args.lookups)]
+        for fn in (orm, raw):
+            # warm up the pool and the prepared statement caches
+            await latency(fn, sample[:500])
+
+        print(f"{'path':>6} {'p50 us':>8} {'p99 us':>8} {'mean us':>8} {'peak KiB':>9} {'live blocks':>12}")
+        for fn in (orm, raw):
+            timings = sorted(await latency(fn, sample))
+            peak, blocks = await allocations(fn, sample[:200])
+            print(
+                f"{fn.__name__:>6} {timings[len(timings) // 2] * 1e6:>8.0f} "
+                f"{timings[int(len(timings) * 0.99)] * 1e6:>8.0f} {statistics.mean(timings) * 1e6:>8.0f} "
+                f"{peak / 1024:>9.1f} {blocks:>12.1f}"
+            )
+    finally:
+        async with database.SessionLocal() as db:
+            await db.execute(delete(LinkModel).where(LinkModel.short_code.startswith(PREFIX)))
+            await db.commit()
+        await database.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""
+Extraction throughput of process-text, before and after sharing the extractor.
+
+"before" builds a fresh URLExtract for every call, as _extract_urls used to;
+"after" uses the process-wide extractor from src.link.utils.url_extractor.
+
+    python -m benchmarks.url_extract_throughput
+"""
+import time
+import random
+from dotenv import load_dotenv
+
+# importing src reads its settings; nothing here connects to the database
+load_dotenv()
+
+from urlextract import URLExtract
+
+from src.link.utils import url_extractor
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+URLS = [
+    "https://example.com/landing?utm_source=mail",
+    "http://shop.example.org/cart/42",
+    "www.example.net/docs/getting-started",
+    "example.io",
+]
+
+
+def make_text(size: int, url_every: int = 40) -> str:
+    rnd = random.Random(42)
+    parts = []
+    length = 0
+    while length < size:
+        token = rnd.choice(URLS) if rnd.randrange(url_every) == 0 else rnd.choice(WORDS)
+        parts.append(token)
+        length += len(token) + 1
+    return " ".join(parts)
+
+
+def before(text: str):
+    return URLExtract().find_urls(text)
+
+
+def after(text: str):
+    return url_extractor.extract_urls(text)
+
+
+def measure(fn, text: str, min_seconds: float = 1.0) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn(text)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+    return calls * len(text.encode("utf-8")) / elapsed / 1e6
+
+
+def main():
+    url_extractor.warm_up()
+    print(f"{'input':>10} {'before MB/s':>12} {'after MB/s':>12}")
+    for size in (1_000, 10_000, 100_000, 1_000_000):
+        text = make_text(size)
+        assert before(text) == after(text)
+        print(f"{size:>10} {measure(before, text):>12.2f} {measure(after, text):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Redirect-only ASGI app for edge nodes without database access.
+
+    EDGE_SNAPSHOT_DIR=/srv/snapshot python3 -m uvicorn edge.app:app --port 8005
+
+Answers GET and HEAD /l/{short_code} from the snapshot files in
+EDGE_SNAPSHOT_DIR (see edge/snapshot.py), with the same status, Location
+and 404 body as the main app. The directory is checked for new or
+replaced files at most every EDGE_RELOAD_SECONDS, so copying in a new
+snapshot or delta swaps it in without a restart.
+"""
+import os
+import json
+import time
+import logging
+from typing import Optional
+from dotenv import load_dotenv
+
+from edge.snapshot import SnapshotStore
+
+load_dotenv()
+
+SNAPSHOT_DIR = os.environ.get("EDGE_SNAPSHOT_DIR", "snapshot")
+RELOAD_SECONDS = float(os.environ.get("EDGE_RELOAD_SECONDS", 5))
+
+PREFIX = "/l/"
+
+_logger = logging.getLogger(__name__)
+
+_NOT_FOUND = json.dumps({"detail": "Link not found"}, separators=(",", ":")).encode()
+_NO_ROUTE = json.dumps({"detail": "Not Found"}, separators=(",", ":")).encode()
+_NOT_READY = json.dumps({"detail": "No snapshot loaded"}, separators=(",", ":")).encode()
+
+
+class EdgeApp:
+    def __init__(self, directory: str, reload_seconds: float) -> None:
+        self.store = SnapshotStore(directory)
+        self.reload_seconds = reload_seconds
+        self._next_reload = 0.0
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        self._maybe_reload()
+        path = scope["path"]
+        code = path[len(PREFIX):] if path.startswith(PREFIX) else ""
+        if scope["method"] not in ("GET", "HEAD") or not code or "/" in code:
+            await _send(send, scope, 404, _NO_ROUTE)
+        elif not self.store.ready:
+            await _send(send, scope, 503, _NOT_READY)
+        else:
+            found = self.store.lookup(code)
+            if found is None:
+                await _send(send, scope, 404, _NOT_FOUND)
+            else:
+                location, status = found
+                await _send(send, scope, status, b"", location)
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_reload:
+            return
+        self._next_reload = now + self.reload_seconds
+        try:
+            if self.store.reload():
+                _logger.info(f"Serving redirect snapshot as of {self.store.as_of}")
+        except (OSError, ValueError) as e:
+            # the files mapped before stay in use
+            _logger.error(f"Loading the redirect snapshot failed: {str(e)}")
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._maybe_reload()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.store.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+async def _send(send, scope, status: int, body: bytes, location: Optional[bytes] = None) -> None:
+    headers = [(b"content-length", str(len(body)).encode())]
+    if body:
+        headers.append((b"content-type", b"application/json"))
+    if location is not None:
+        headers.append((b"location", location))
+
+    # what the main app's CORSMiddleware (any origin, with credentials) adds:
+    # any origin, except that a request with cookies gets its own origin back
+    origin = _header(scope, b"origin")
+    if origin is not None:
+        if _header(scope, b"cookie") is not None:
+            headers.append((b"access-control-allow-origin", origin))
+            headers.append((b"vary", b"Origin"))
+        else:
+            headers.append((b"access-control-allow-origin", b"*"))
+        headers.append((b"access-control-allow-credentials", b"true"))
+
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+app = EdgeApp(SNAPSHOT_DIR, RELOAD_SECONDS)
@@ -0,0 +1,317 @@
+"""
+Immutable, memory-mapped redirect snapshots for edge nodes.
+
+A snapshot file is a 64 byte header followed by three sections:
+
+- keys: ``count`` short codes in UTF-8, right-padded with NUL to
+  ``key_width`` bytes and sorted bytewise, so a code is found by binary
+  search directly in the mapping;
+- records: for each key, the offset and length of its Location header in
+  the heap and its redirect status (0 marks a code deleted by a delta);
+- heap: the Location header values, already quoted, back to back.
+
+A directory holds one full snapshot, ``links.snap``, and any number of
+deltas, ``links-delta-<ms>.snap``, with the links written and the codes
+deleted since an earlier snapshot. Lookups check the deltas newest first,
+then the full snapshot. Files are written under a temporary name and
+renamed into place, so readers only ever map complete files.
+
+This module only uses the standard library, so edge nodes can run it
+without the application's settings or dependencies.
+"""
+import os
+import mmap
+import struct
+import logging
+import tempfile
+import shutil
+from urllib.parse import quote
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"LSSNAP01"
+KIND_FULL = 0
+KIND_DELTA = 1
+# magic, kind, key width, entry count, records offset, heap offset, heap size, as of, since
+_HEADER = struct.Struct("<8sBB6xQQQQdd")
+HEADER_SIZE = 64
+
+# heap offset, location length, status
+_RECORD = struct.Struct("<QIH2x")
+DELETED = 0
+MAX_KEY_BYTES = 255
+
+BASE_NAME = "links.snap"
+DELTA_PREFIX = "links-delta-"
+SUFFIX = ".snap"
+# Keys are written to the file in chunks of this many
+_KEY_CHUNK = 65536
+
+_logger = logging.getLogger(__name__)
+
+
+def location_header(url: str) -> bytes:
+    # quoted like starlette's RedirectResponse; the result is plain ASCII
+    return quote(url, safe=":/%#?=@[]!$&'()*+,;").encode("ascii")
+
+
+def delta_name(as_of: float) -> str:
+    # zero padded, so names sort in the order the deltas were taken
+    return f"{DELTA_PREFIX}{int(as_of * 1000):015d}{SUFFIX}"
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class SnapshotWriter:
+    """
+    Writes a snapshot file from entries added in strictly increasing byte
+    order of their codes.
+
+    Keys, records and URLs are spooled to temporary files next to ``path``
+    while entries are added, so memory use does not depend on the number
+    of links. commit() assembles the file under a temporary name, syncs it
+    and renames it over ``path``.
+    """
+
+    def __init__(self, path: str, kind: int, as_of: float, since: float = 0.0) -> None:
+        self.path = path
+        self.kind = kind
+        self.as_of = as_of
+        self.since = since
+        self.count = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        self._keys = tempfile.TemporaryFile(dir=directory)
+        self._records = tempfile.TemporaryFile(dir=directory)
+        self._heap = tempfile.TemporaryFile(dir=directory)
+        self._heap_size = 0
+        self._key_width = 1
+        self._last: Optional[bytes] = None
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, code: str, url: str, status: int) -> None:
+        self._add(code, location_header(url), status)
+
+    def delete(self, code: str) -> None:
+        if self.kind != KIND_DELTA:
+            raise ValueError("Only deltas can delete codes")
+        self._add(code, b"", DELETED)
+
+    def _add(self, code: str, location: bytes, status: int) -> None:
+        key = code.encode("utf-8")
+        if not key or len(key) > MAX_KEY_BYTES or b"\0" in key:
+            raise ValueError(f"Short code cannot be stored in a snapshot: {code!r}")
+        if self._last is not None and key <= self._last:
+            raise ValueError("Codes must be added in increasing byte order")
+        self._last = key
+        self._key_width = max(self._key_width, len(key))
+
+        self._keys.write(bytes((len(key),)) + key)
+        self._records.write(_RECORD.pack(self._heap_size, len(location), status))
+        self._heap.write(location)
+        self._heap_size += len(location)
+        self.count += 1
+
+    def commit(self) -> None:
+        width = self._key_width
+        records_offset = _align(HEADER_SIZE + self.count * width)
+        heap_offset = records_offset + self.count * _RECORD.size
+
+        tmp = f"{self.path}.tmp.{os.getpid()}"
+        try:
+            with open(tmp, "wb") as out:
+                out.write(_HEADER.pack(
+                    MAGIC, self.kind, width, self.count, records_offset,
+                    heap_offset, self._heap_size, self.as_of, self.since,
+                ))
+                self._keys.seek(0)
+                remaining = self.count
+                while remaining:
+                    chunk = []
+                    for _ in range(min(remaining, _KEY_CHUNK)):
+                        length = self._keys.read(1)[0]
+                        chunk.append(self._keys.read(length).ljust(width, b"\0"))
+                    out.write(b"".join(chunk))
+                    remaining -= len(chunk)
+                out.write(bytes(records_offset - HEADER_SIZE - self.count * width))
+                for spool in (self._records, self._heap):
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        # make the rename itself durable
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        for spool in (self._keys, self._records, self._heap):
+            spool.close()
+
+
+class Snapshot:
+    """A read-only mapping of one snapshot file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER_SIZE:
+                raise ValueError(f"{path} is not a redirect snapshot")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # identifies the file the name pointed to when it was mapped
+        self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        (
+            magic, self.kind, self.key_width, self.count, self._records_offset,
+            self._heap_offset, heap_size, self.as_of, self.since,
+        ) = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or self._heap_offset + heap_size != stat.st_size:
+            mm.close()
+            raise ValueError(f"{path} is not a complete redirect snapshot")
+        self._mm = mm
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def lookup(self, key: bytes) -> Optional[Tuple[bytes, int]]:
+        """
+        (location, status) stored for the UTF-8 encoded code ``key``, with
+        status DELETED for a deleted code, or None if this file has no entry.
+        """
+        width = self.key_width
+        if len(key) > width:
+            return None
+        padded = key.ljust(width, b"\0")
+        mm = self._mm
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            offset = HEADER_SIZE + mid * width
+            probe = mm[offset:offset + width]
+            if probe < padded:
+                lo = mid + 1
+            elif probe > padded:
+                hi = mid
+            else:
+                heap_start, length, status = _RECORD.unpack_from(
+                    mm, self._records_offset + mid * _RECORD.size
+                )
+                start = self._heap_offset + heap_start
+                return mm[start:start + length], status
+        return None
+
+
+class SnapshotStore:
+    """
+    The full snapshot and deltas in a directory, as seen at the last reload().
+
+    reload() maps files that are new or were replaced since the last call
+    and unmaps the rest; unchanged files stay mapped. Deltas taken before
+    the full snapshot are ignored. A delta that does not reach back to the
+    previous file (its ``since`` is later than that file's ``as_of``)
+    leaves a gap, which is logged: changes in the gap are missing until
+    the next full snapshot.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._files: Dict[str, Snapshot] = {}
+        # newest first; the full snapshot is last
+        self._layers: List[Snapshot] = []
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._layers)
+
+    @property
+    def as_of(self) -> Optional[float]:
+        return self._layers[0].as_of if self._layers else None
+
+    def reload(self) -> bool:
+        """Pick up changed files; returns whether anything changed."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        if BASE_NAME not in names:
+            changed = bool(self._files)
+            self._swap({}, [])
+            return changed
+
+        paths = [os.path.join(self.directory, BASE_NAME)] + [
+            os.path.join(self.directory, name)
+            for name in sorted(names)
+            if name.startswith(DELTA_PREFIX) and name.endswith(SUFFIX)
+        ]
+        files, opened = {}, []
+        try:
+            for path in paths:
+                current = self._files.get(path)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if current is not None and current.identity == (
+                    stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+                ):
+                    files[path] = current
+                    continue
+                opened.append(Snapshot(path))
+                files[path] = opened[-1]
+            base = files.get(paths[0])
+            if base is None or base.kind != KIND_FULL:
+                raise ValueError(f"{paths[0]} is not a full redirect snapshot")
+        except BaseException:
+            # keep serving what was mapped before
+            for snapshot in opened:
+                snapshot.close()
+            raise
+        if not opened and len(files) == len(self._files):
+            return False
+
+        deltas = sorted(
+            (f for f in files.values() if f.kind == KIND_DELTA and f.as_of > base.as_of),
+            key=lambda f: f.as_of,
+        )
+        previous = base
+        for delta in deltas:
+            if delta.since > previous.as_of:
+                _logger.warning(
+                    f"{delta.path} starts after {previous.path} ends; changes in between are missing"
+                )
+            previous = delta
+        self._swap(files, deltas[::-1] + [base])
+        return True
+
+    def _swap(self, files: Dict[str, Snapshot], layers: List[Snapshot]) -> None:
+        stale = [f for f in self._files.values() if f not in files.values()]
+        self._files, self._layers = files, layers
+        for snapshot in stale:
+            snapshot.close()
+
+    def lookup(self, code: str) -> Optional[Tuple[bytes, int]]:
+        """(location, status) of ``code``, or None if it does not exist."""
+        key = code.encode("utf-8")
+        for layer in self._layers:
+            found = layer.lookup(key)
+            if found is not None:
+                return None if found[1] == DELETED else found
+        return None
+
+    def close(self) -> None:
+        self._swap({}, [])
@@ -1,19 +1,25 @@
-import os
 import uuid
 from datetime import datetime
+from typing import List
 
 from sqlalchemy.orm import declared_attr
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import (
     Column,
     String,
     Integer,
+    BigInteger,
+    SmallInteger,
     DateTime,
     ForeignKey,
+    Index,
+    LargeBinary,
     UniqueConstraint,
+    inspect,
 )
-from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.db.sql_alchemy import Database
 
 # Base for declarative models
 Base = declarative_base()
@@ -60,22 +66,162 @@ class LinkModel(ParentBase):
     # Short code (unique, indexed)
     short_code = Column(String, unique=True, index=True, nullable=False)
 
+    # Digest of the canonical original_url, used to reuse links for identical destinations
+    url_hash = Column(LargeBinary(16), index=True, nullable=True)
+
+    # Redirect target and status (301 for images, 307 otherwise), computed when the link is written
+    destination_url = Column(String, nullable=True)
+    redirect_status = Column(SmallInteger, nullable=True)
+
+    # Owner of the link; null for links created before ownership was recorded
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+
     __table_args__ = (
         UniqueConstraint("short_code", name="uq_links_short_code"),
+        # keyset pagination of a user's links
+        Index("ix_links_user_id_id", "user_id", "id"),
+        # incremental sync of in-process short code filters
+        Index("ix_links_updated_at", "updated_at"),
     )
 
 
-async def init_db():
-    username = os.environ.get("POSTGRES_USERNAME")
-    password = os.environ.get("POSTGRES_PASSWORD")
-    host = os.environ.get("POSTGRES_HOST")
-    port = os.environ.get("POSTGRES_PORT")
-    database = os.environ.get("POSTGRES_DB")
-    DATABASE_URL = (
-        f"postgresql+asyncpg://{username}:{password}@{host}:{port}/{database}"
+class JobModel(ParentBase):
+    __tablename__ = "jobs"
+
+    id = Column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4,
+        unique=True,
+        nullable=False,
+    )
+
+    # Owner of the job, only they can poll it
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+
+    # "process-text" or "bulk"
+    kind = Column(String, nullable=False)
+
+    # pending -> running -> succeeded | failed
+    status = Column(String, nullable=False, default="pending")
+
+    payload = Column(JSONB, nullable=False)
+    result = Column(JSONB, nullable=True)
+    error = Column(String, nullable=True)
+
+    # Jobs and their results are purged after this time
+    expires_at = Column(DateTime, index=True, nullable=False)
+
+
+class LinkImportModel(ParentBase):
+    __tablename__ = "link_imports"
+
+    # Name of the import, by default the absolute path of the CSV file
+    name = Column(String, primary_key=True, nullable=False)
+
+    # Data rows of the file already merged into links; committed with each batch
+    rows_done = Column(Integer, nullable=False, default=0)
+    conflicts = Column(Integer, nullable=False, default=0)
+
+
+class LinkTombstoneModel(ParentBase):
+    __tablename__ = "link_tombstones"
+
+    # Short code that stopped pointing anywhere, by delete or rename; deleted_at is when.
+    # Lets snapshot deltas carry deletions, which leave nothing behind in links
+    short_code = Column(String, primary_key=True, nullable=False)
+
+    __table_args__ = (
+        Index("ix_link_tombstones_deleted_at", "deleted_at"),
     )
 
-    engine = create_async_engine(DATABASE_URL, future=True, echo=False)
-    async with engine.begin() as conn:
+
+class LinkClickModel(ParentBase):
+    __tablename__ = "link_clicks"
+
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+
+    # Redirects served, added in batches by every worker; kept off links so
+    # counting never touches the rows redirects read
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+# Clicks per link and time bucket (UTC). Minute rows are written by every
+# flush and rolled into hour and day rows once their hour has passed, so
+# the hour and day rows are only updated by the rollup, not by redirects.
+# Bucket rows are not soft-deleted, so they leave out ParentBase's timestamps
+class LinkClickMinuteModel(Base):
+    __tablename__ = "link_clicks_minute"
+
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    bucket = Column(DateTime, primary_key=True, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # the rollup takes the oldest minutes across all links
+        Index("ix_link_clicks_minute_bucket", "bucket"),
+    )
+
+
+class LinkClickHourModel(Base):
+    __tablename__ = "link_clicks_hour"
+
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    bucket = Column(DateTime, primary_key=True, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # purge of hours past their retention
+        Index("ix_link_clicks_hour_bucket", "bucket"),
+    )
+
+
+class LinkClickDayModel(Base):
+    __tablename__ = "link_clicks_day"
+
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    bucket = Column(DateTime, primary_key=True, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+
+
+# create_all only creates missing tables. Changes to tables that may already
+# be large are applied by src.link.commands.migrate, without long write locks
+COLUMN_UPGRADES = [
+    "ALTER TABLE links ADD COLUMN IF NOT EXISTS url_hash BYTEA",
+    "ALTER TABLE links ADD COLUMN IF NOT EXISTS destination_url VARCHAR",
+    "ALTER TABLE links ADD COLUMN IF NOT EXISTS redirect_status SMALLINT",
+    "ALTER TABLE links ADD COLUMN IF NOT EXISTS user_id UUID",
+]
+
+# (name, table, definition); added NOT VALID, then validated without blocking writes
+CONSTRAINT_UPGRADES = [
+    ("links_user_id_fkey", "links", "FOREIGN KEY (user_id) REFERENCES users (id)"),
+]
+
+# (name, table, columns); built with CREATE INDEX CONCURRENTLY
+INDEX_UPGRADES = [
+    ("ix_links_url_hash", "links", "url_hash"),
+    ("ix_links_user_id_id", "links", "user_id, id"),
+    ("ix_links_updated_at", "links", "updated_at"),
+]
+
+
+def _missing_columns(connection) -> List[str]:
+    inspector = inspect(connection)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in existing)
+    return missing
+
+
+async def init_db():
+    async with Database().engine.begin() as conn:
         # Run the synchronous DDL creation in the async context
         await conn.run_sync(Base.metadata.create_all)
+        missing = await conn.run_sync(_missing_columns)
+    if missing:
+        raise RuntimeError(
+            f"The database schema is out of date (missing {', '.join(missing)}); "
+            "run python -m src.link.commands.migrate"
+        )
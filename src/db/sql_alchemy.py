@@ -1,28 +1,202 @@
 import os
+import time
+import asyncio
+import asyncpg
+from typing import Iterable
 
+from sqlalchemy import event
+from sqlalchemy.engine import Result
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     AsyncSession,
 )
 
+from src.share.cache import TTLCache
+from src.share.logging import Logging
+from src.util.env import env_bool
+from src.util.singleton import Singleton
+
+# Errors that send reads back to the primary; asyncpg errors surface as OSError
+# while connecting and as its own exception types once connected
+_REPLICA_ERRORS = (DBAPIError, OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError)
+
+# Session.info flag: the session has written, so its reads must see the primary
+_WROTE = "wrote"
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement_writes(state) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info[_WROTE] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush_writes(session, flush_context) -> None:
+    session.info[_WROTE] = True
+
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": env_bool("DB_POOL_PRE_PING", "true"),
+    }
+
+
+# Prepared statements cached per connection, both by SQLAlchemy's adapter for ORM
+# and Core queries and by asyncpg itself for raw queries such as fetchrow()
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
+
+def _connect_args(**extra) -> dict:
+    return {"statement_cache_size": STATEMENT_CACHE_SIZE, **extra}
+
+
+def _database_url(prefix: str, fallback: str = "POSTGRES") -> str:
+    def setting(name: str):
+        return os.environ.get(f"{prefix}_{name}") or os.environ.get(f"{fallback}_{name}")
+
+    return (
+        f"postgresql+asyncpg://{setting('USERNAME')}:{setting('PASSWORD')}"
+        f"@{setting('HOST')}:{setting('PORT')}/{setting('DB')}"
+        f"?prepared_statement_cache_size={STATEMENT_CACHE_SIZE}"
+    )
+
+
+class Database(metaclass=Singleton):
+    """
+    The process-wide engines and session factories.
+
+    Every module shares this one instance, so a worker holds a single
+    asyncpg pool per database sized by the DB_POOL_* settings. Connections
+    are opened lazily on first use; dispose() closes them at shutdown.
+
+    When any POSTGRES_READ_* setting is present, read() sends read-only
+    queries to that replica; all other statements use the primary.
+    """
 
-class Database:
     def __init__(self):
-        username = os.environ.get("POSTGRES_USERNAME")
-        password = os.environ.get("POSTGRES_PASSWORD")
-        host = os.environ.get("POSTGRES_HOST")
-        port = os.environ.get("POSTGRES_PORT")
-        database = os.environ.get("POSTGRES_DB")
-        DATABASE_URL = (
-            f"postgresql+asyncpg://{username}:{password}@{host}:{port}/{database}"
+        self.engine = create_async_engine(
+            _database_url("POSTGRES"),
+            future=True,
+            echo=False,
+            connect_args=_connect_args(),
+            **_pool_options(),
         )
-
-        self.engine = create_async_engine(DATABASE_URL, future=True, echo=False)
         self.SessionLocal = async_sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine, expire_on_commit=False
         )
 
+        self.read_engine = None
+        self.ReadSessionLocal = None
+        if any(
+            os.environ.get(f"POSTGRES_READ_{name}")
+            for name in ("HOST", "PORT", "DB", "USERNAME", "PASSWORD")
+        ):
+            self.read_engine = create_async_engine(
+                _database_url("POSTGRES_READ"),
+                future=True,
+                echo=False,
+                # fail over to the primary quickly when the replica is unreachable
+                connect_args=_connect_args(timeout=float(os.environ.get("DB_READ_CONNECT_TIMEOUT", 5))),
+                **_pool_options(),
+            )
+            self.ReadSessionLocal = async_sessionmaker(
+                autocommit=False, autoflush=False, bind=self.read_engine, expire_on_commit=False
+            )
+
+        # keys written recently by this process; their reads go to the primary
+        self.read_your_writes_seconds = float(os.environ.get("DB_READ_YOUR_WRITES_SECONDS", 5))
+        self._pinned: TTLCache[bool] = TTLCache(
+            max_size=int(os.environ.get("DB_READ_YOUR_WRITES_MAX_KEYS", 100000)),
+            ttl=self.read_your_writes_seconds,
+        )
+        # after a replica error, reads stay on the primary until this time
+        self.read_retry_seconds = float(os.environ.get("DB_READ_RETRY_SECONDS", 30))
+        self._replica_down_until = 0.0
+
     async def get_db(self) -> AsyncSession:
         async with self.SessionLocal() as session:
             yield session
+
+    def pin(self, *keys: str) -> None:
+        """Send reads of ``keys`` to the primary for DB_READ_YOUR_WRITES_SECONDS."""
+        if self.read_engine is None or self.read_your_writes_seconds <= 0:
+            return
+        for key in keys:
+            self._pinned.set(key, True)
+
+    def reads_primary(self, db: AsyncSession, keys: Iterable[str] = ()) -> bool:
+        """Whether read() and fetchrow() would use the primary for this session and keys."""
+        return (
+            self.read_engine is None
+            or db.info.get(_WROTE)
+            or time.monotonic() < self._replica_down_until
+            or any(self._pinned.get(key) for key in keys)
+        )
+
+    def _replica_failed(self, e: Exception) -> None:
+        self._replica_down_until = time.monotonic() + self.read_retry_seconds
+        Logging().get_logger().warning(f"Read replica failed, using the primary: {str(e)}")
+
+    async def read(self, db: AsyncSession, stmt, keys: Iterable[str] = ()) -> Result:
+        """
+        Execute a read-only statement, on the replica when one is configured.
+
+        The primary session ``db`` is used instead when there is no replica,
+        when ``db`` has already written (so a request reads its own writes),
+        when one of ``keys`` was pinned by a recent write, or while the
+        replica is failing. ORM objects loaded from the replica are detached.
+        """
+        if self.reads_primary(db, keys):
+            return await db.execute(stmt)
+
+        try:
+            async with self.ReadSessionLocal() as replica:
+                res = await replica.execute(stmt)
+                # materialize the rows before the replica session is closed
+                return res.freeze()()
+        except _REPLICA_ERRORS as e:
+            self._replica_failed(e)
+            return await db.execute(stmt)
+
+    async def fetchrow(self, db: AsyncSession, sql: str, *args, keys: Iterable[str] = ()):
+        """
+        Run raw SQL with asyncpg's fetchrow, routed like read().
+
+        asyncpg prepares the statement once per connection and caches it,
+        and the row comes back as an asyncpg Record: no compilation, ORM
+        loading or identity map work. Use $1, $2... placeholders.
+        """
+        if not self.reads_primary(db, keys):
+            try:
+                async with self.read_engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    return await raw.driver_connection.fetchrow(sql, *args)
+            except _REPLICA_ERRORS as e:
+                self._replica_failed(e)
+
+        raw = await (await db.connection()).get_raw_connection()
+        return await raw.driver_connection.fetchrow(sql, *args)
+
+    async def connect_raw(self) -> asyncpg.Connection:
+        """A plain asyncpg connection to the primary, outside the pool, e.g. for LISTEN."""
+        url = self.engine.url
+        return await asyncpg.connect(
+            user=url.username,
+            password=url.password,
+            host=url.host,
+            port=url.port,
+            database=url.database,
+            statement_cache_size=STATEMENT_CACHE_SIZE,
+        )
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
+        if self.read_engine is not None:
+            await self.read_engine.dispose()
@@ -0,0 +1,82 @@
+"""
+Fill columns derived from original_url on links created before they existed.
+
+    python -m src.link.commands.backfill [--batch-size 5000]
+
+Rows are processed in id order in batches, each committed on its own, so the
+command can be interrupted and re-run at any time.
+"""
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import select, update, bindparam, or_
+
+from src.db.models import LinkModel, init_db
+from src.db.sql_alchemy import Database
+from src.link.utils.redirect import derived_link_values
+
+
+async def backfill(batch_size: int) -> int:
+    database = Database()
+    table = LinkModel.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        # derived columns are not a change to the link, so updated_at is kept
+        .values(
+            url_hash=bindparam("b_url_hash"),
+            destination_url=bindparam("b_destination_url"),
+            redirect_status=bindparam("b_redirect_status"),
+            updated_at=table.c.updated_at,
+        )
+    )
+
+    total = 0
+    last_id = 0
+    started = time.monotonic()
+    async with database.SessionLocal() as db:
+        while True:
+            res = await db.execute(
+                select(table.c.id, table.c.original_url)
+                .where(
+                    table.c.id > last_id,
+                    or_(table.c.url_hash.is_(None), table.c.redirect_status.is_(None)),
+                )
+                .order_by(table.c.id)
+                .limit(batch_size)
+            )
+            rows = res.tuples().all()
+            if not rows:
+                break
+
+            params = []
+            for link_id, original_url in rows:
+                values = derived_link_values(original_url)
+                params.append({"b_id": link_id, **{f"b_{k}": v for k, v in values.items()}})
+            await db.execute(stmt, params)
+            await db.commit()
+
+            total += len(rows)
+            last_id = rows[-1][0]
+            elapsed = time.monotonic() - started
+            print(f"backfilled {total} links ({total / elapsed:.0f} rows/s), last id {last_id}")
+    return total
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    await init_db()
+    total = await backfill(args.batch_size)
+    print(f"done, {total} links updated")
+    await Database().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+Export the redirects of all links to snapshot files for edge nodes.
+
+    python -m src.link.commands.export_snapshot DIR [--delta] [--batch-size 10000]
+
+A full export writes DIR/links.snap from a streaming scan of links.
+--delta writes DIR/links-delta-<ms>.snap with only the links written and
+the codes deleted since the newest file in DIR, starting
+SNAPSHOT_OVERLAP_SECONDS earlier to cover transactions that were still
+open then. Edge nodes copy the directory (e.g. with rsync) and serve it
+with edge.app; see edge/snapshot.py for the file format.
+
+Files are replaced atomically. A full export removes the deltas it
+supersedes from DIR, and tombstones of deletions older than it from the
+database.
+"""
+import os
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from edge.snapshot import (
+    BASE_NAME,
+    DELTA_PREFIX,
+    KIND_DELTA,
+    KIND_FULL,
+    SnapshotStore,
+    SnapshotWriter,
+    delta_name,
+)
+from src.db.models import init_db
+from src.db.sql_alchemy import Database
+from src.link.utils.redirect import resolve_destination
+from src.link.repositories.link_repository import LinkRepository
+
+# Must cover clock skew between hosts and the longest write transaction
+SNAPSHOT_OVERLAP_SECONDS = int(os.environ.get("SNAPSHOT_OVERLAP_SECONDS", 30))
+
+
+async def export(directory: str, delta: bool, batch_size: int) -> str:
+    database = Database()
+    repository = LinkRepository()
+    # taken before the scan, so the next delta covers anything the scan missed
+    as_of = time.time()
+
+    since = None
+    if delta:
+        store = SnapshotStore(directory)
+        store.reload()
+        if not store.ready:
+            raise ValueError(f"{directory} has no full snapshot to take a delta of")
+        since = store.as_of - SNAPSHOT_OVERLAP_SECONDS
+        store.close()
+    path = os.path.join(directory, delta_name(as_of) if delta else BASE_NAME)
+
+    started = time.monotonic()
+    async with database.SessionLocal() as db:
+        since_at = datetime.utcfromtimestamp(since) if since is not None else None
+        deleted = await repository.deleted_codes(db, since_at) if delta else []
+        with SnapshotWriter(path, KIND_DELTA if delta else KIND_FULL, as_of, since or 0.0) as writer:
+            # both lists are in byte order; merge deletions into the scan
+            pending = iter(deleted)
+            next_deleted = next(pending, None)
+            skipped = 0
+            async for rows in repository.stream_redirects(db, batch_size, since_at):
+                for code, original_url, destination_url, redirect_status in rows:
+                    while next_deleted is not None and next_deleted.encode() < code.encode():
+                        writer.delete(next_deleted)
+                        next_deleted = next(pending, None)
+                    if next_deleted == code:
+                        # re-created after the deletions were read
+                        next_deleted = next(pending, None)
+                    if redirect_status is None:
+                        # not backfilled yet
+                        destination_url, redirect_status = resolve_destination(original_url)
+                    try:
+                        writer.add(code, destination_url, redirect_status)
+                    except ValueError as e:
+                        skipped += 1
+                        print(f"skipped: {str(e)}")
+                elapsed = time.monotonic() - started
+                print(f"exported {writer.count} entries ({writer.count / elapsed:.0f} rows/s)")
+            while next_deleted is not None:
+                writer.delete(next_deleted)
+                next_deleted = next(pending, None)
+            writer.commit()
+        print(f"wrote {path}: {writer.count} entries, {len(deleted)} deletions, {skipped} skipped")
+
+        if not delta:
+            # older deltas are ignored by readers of the new snapshot anyway
+            for name in os.listdir(directory):
+                if name.startswith(DELTA_PREFIX) and name < delta_name(as_of):
+                    os.unlink(os.path.join(directory, name))
+            # no delta will ever start before the new snapshot
+            purged = await repository.purge_tombstones(
+                db, datetime.utcfromtimestamp(as_of - SNAPSHOT_OVERLAP_SECONDS)
+            )
+            print(f"purged {purged} tombstones")
+    return path
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--delta", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    await init_db()
+    try:
+        await export(args.directory, args.delta, args.batch_size)
+    finally:
+        await Database().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,248 @@
+"""
+Import links from a CSV file with original_url and short_code columns.
+
+    python -m src.link.commands.import_csv links.csv [--batch-size 50000]
+        [--report links.csv.conflicts.csv] [--user-id UUID] [--name NAME]
+
+Each batch is loaded with COPY into a temporary staging table and merged
+into links with INSERT ... ON CONFLICT DO NOTHING, so the unique short code
+constraint is enforced by Postgres itself. Rows that were not imported
+(short code already in use, repeated in the file, or a missing URL) are
+appended to the conflict report. Rows with an empty short_code get a
+generated one, and another one if it is taken by an existing custom code.
+
+Progress is stored in link_imports in the same transaction as each batch,
+so an interrupted import resumes after the last committed batch when run
+again with the same file (or --name). The codes of each batch are announced
+to running workers with the commit, like links created through the API.
+The conflicts of a batch are written
+to the report before it is committed, so none are lost; a batch
+interrupted in between has its conflicts reported twice.
+"""
+import os
+import csv
+import time
+import asyncio
+import argparse
+from uuid import UUID
+from itertools import islice
+from datetime import datetime
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text, bindparam
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+
+from src.db.models import LinkImportModel, init_db
+from src.db.sql_alchemy import Database
+from src.link.utils.short_code import encode_id
+from src.link.utils.redirect import derived_link_values
+from src.link.services.link_service import MAX_CODE_ATTEMPTS
+from src.link.services.invalidation import publish_invalidation
+from src.link.repositories.link_repository import LinkRepository
+
+STAGING_TABLE = "links_import"
+STAGING_COLUMNS = [
+    "line", "id", "original_url", "short_code", "url_hash", "destination_url", "redirect_status",
+]
+
+CREATE_STAGING = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+    line BIGINT NOT NULL,
+    id INTEGER,
+    original_url VARCHAR NOT NULL,
+    short_code VARCHAR NOT NULL,
+    url_hash BYTEA,
+    destination_url VARCHAR,
+    redirect_status SMALLINT
+) ON COMMIT DELETE ROWS
+"""
+
+# Inserts the staged batch and returns the staged rows that were not inserted
+MERGE = text(f"""
+WITH inserted AS (
+    INSERT INTO links (
+        id, original_url, short_code, url_hash, destination_url, redirect_status,
+        user_id, created_at, updated_at
+    )
+    SELECT
+        coalesce(id, nextval(pg_get_serial_sequence('links', 'id'))),
+        original_url, short_code, url_hash, destination_url, redirect_status,
+        :user_id, :now, :now
+    FROM {STAGING_TABLE}
+    ON CONFLICT (short_code) DO NOTHING
+    RETURNING short_code
+)
+SELECT s.line, s.original_url, s.short_code
+FROM {STAGING_TABLE} s
+WHERE NOT EXISTS (SELECT 1 FROM inserted i WHERE i.short_code = s.short_code)
+ORDER BY s.line
+""").bindparams(bindparam("user_id", type_=postgresql.UUID(as_uuid=True)))
+
+
+def _open_report(path: str):
+    is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+    report = open(path, "a", newline="", encoding="utf-8")
+    writer = csv.writer(report)
+    if is_new:
+        writer.writerow(["line", "original_url", "short_code", "reason"])
+    return report, writer
+
+
+async def _merge(db, repository: LinkRepository, staged: list, generated: list, user_id: Optional[UUID]) -> list:
+    """
+    Stage and merge one batch; returns the rejected rows. Rows whose generated
+    code is taken by an existing custom code get a new one, like the API does.
+    """
+    retry = generated
+    taken = []
+    for _ in range(MAX_CODE_ATTEMPTS):
+        if retry:
+            for row, link_id in zip(retry, await repository.reserve_ids(db, len(retry))):
+                row[1] = link_id
+                row[3] = encode_id(link_id)
+
+        # COPY runs on the session's own connection, inside its transaction
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            STAGING_TABLE, records=staged, columns=STAGING_COLUMNS
+        )
+        res = await db.execute(MERGE, {"user_id": user_id, "now": datetime.utcnow()})
+        await db.execute(text(f"DELETE FROM {STAGING_TABLE}"))
+
+        retry_lines = {row[0] for row in retry}
+        retry = []
+        by_line = {row[0]: row for row in staged}
+        for line, original_url, short_code in res.tuples():
+            if line in retry_lines:
+                retry.append(by_line[line])
+            else:
+                taken.append((line, original_url, short_code, "short code already in use"))
+        if not retry:
+            return taken
+        staged = retry
+
+    taken.extend(
+        (row[0], row[2], "", "could not generate a free short code") for row in retry
+    )
+    return taken
+
+
+async def import_csv(
+    path: str,
+    name: str,
+    batch_size: int,
+    report_path: str,
+    user_id: Optional[UUID] = None,
+) -> Tuple[int, int]:
+    database = Database()
+    repository = LinkRepository()
+
+    async with database.SessionLocal() as db:
+        checkpoint = await db.get(LinkImportModel, name)
+        rows_done = checkpoint.rows_done if checkpoint else 0
+        conflicts = checkpoint.conflicts if checkpoint else 0
+        await db.commit()
+        if rows_done:
+            print(f"resuming {name} after row {rows_done}")
+
+        imported = 0
+        started = time.monotonic()
+        report, report_writer = _open_report(report_path)
+        with open(path, newline="", encoding="utf-8") as source, report:
+            reader = csv.DictReader(source)
+            missing = {"original_url", "short_code"} - set(reader.fieldnames or [])
+            if missing:
+                raise ValueError(f"{path} is missing the column(s): {', '.join(sorted(missing))}")
+
+            rows = enumerate(islice(reader, rows_done, None), start=rows_done + 1)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                rejected = []
+                staged = []
+                # staged rows that get a generated code
+                generated = []
+                codes = set()
+                for line, row in batch:
+                    original_url = (row["original_url"] or "").strip()
+                    short_code = (row["short_code"] or "").strip()
+                    if not original_url:
+                        rejected.append((line, original_url, short_code, "missing original_url"))
+                        continue
+                    if short_code in codes:
+                        rejected.append((line, original_url, short_code, "duplicate short code in file"))
+                        continue
+                    derived = derived_link_values(original_url)
+                    staged.append([
+                        line, None, original_url, short_code,
+                        derived["url_hash"], derived["destination_url"], derived["redirect_status"],
+                    ])
+                    if short_code:
+                        codes.add(short_code)
+                    else:
+                        generated.append(staged[-1])
+
+                await db.execute(text(CREATE_STAGING))
+                taken = await _merge(db, repository, staged, generated, user_id)
+                rejected.extend(taken)
+                # running workers add the new codes to their short code filters
+                taken_lines = {line for line, _, _, _ in taken}
+                await publish_invalidation(db, [row[3] for row in staged if row[0] not in taken_lines])
+
+                # written before the commit, so a crash between the two cannot lose
+                # rejected rows; at worst an interrupted batch is reported twice
+                report_writer.writerows(sorted(rejected))
+                report.flush()
+                os.fsync(report.fileno())
+
+                rows_done = batch[-1][0]
+                conflicts += len(rejected)
+                await db.execute(
+                    insert(LinkImportModel)
+                    .values(name=name, rows_done=rows_done, conflicts=conflicts)
+                    .on_conflict_do_update(
+                        index_elements=[LinkImportModel.name],
+                        set_={"rows_done": rows_done, "conflicts": conflicts, "updated_at": datetime.utcnow()},
+                    )
+                )
+                await db.commit()
+
+                imported += len(staged) - len(taken)
+                elapsed = time.monotonic() - started
+                print(
+                    f"imported {imported} links ({imported / elapsed:.0f} rows/s), "
+                    f"{conflicts} conflicts, row {rows_done}"
+                )
+    return imported, conflicts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--report", help="conflict report, defaults to <path>.conflicts.csv")
+    parser.add_argument("--user-id", type=UUID, help="owner of the imported links")
+    parser.add_argument("--name", help="checkpoint name, defaults to the absolute path of the file")
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    await init_db()
+    imported, conflicts = await import_csv(
+        path,
+        args.name or path,
+        args.batch_size,
+        args.report or f"{path}.conflicts.csv",
+        args.user_id,
+    )
+    print(f"done, {imported} links imported, {conflicts} conflicts")
+    await Database().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Apply schema changes to an existing database without blocking writes for long.
+
+    python -m src.link.commands.migrate [--lock-timeout 5] [--retries 20]
+
+Run it once when deploying a version that changes existing tables, before
+the new workers start; they refuse to start while columns are missing.
+Every step is idempotent:
+
+- columns are added one statement at a time, waiting at most
+  --lock-timeout seconds for the table lock so a long running query does
+  not queue every other query behind the ALTER, and retried;
+- foreign keys are added NOT VALID and then validated, which does not
+  block writes;
+- indexes are built with CREATE INDEX CONCURRENTLY. An index left invalid
+  by an interrupted build is dropped and built again.
+"""
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from src.db.models import (
+    Base,
+    COLUMN_UPGRADES,
+    CONSTRAINT_UPGRADES,
+    INDEX_UPGRADES,
+)
+from src.db.sql_alchemy import Database
+
+
+async def _with_lock_timeout(conn, statement: str, lock_timeout: float, retries: int) -> None:
+    for attempt in range(retries + 1):
+        try:
+            async with conn.begin():
+                await conn.execute(text(f"SET LOCAL lock_timeout = '{int(lock_timeout * 1000)}ms'"))
+                await conn.execute(text(statement))
+            return
+        except DBAPIError as e:
+            # lock_not_available
+            if getattr(e.orig, "sqlstate", None) != "55P03" or attempt == retries:
+                raise
+            print(f"lock not granted, retrying: {statement}")
+            await asyncio.sleep(1)
+
+
+async def migrate(lock_timeout: float, retries: int) -> None:
+    database = Database()
+    async with database.engine.begin() as conn:
+        # new tables are empty, so creating them is cheap
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with database.engine.connect() as conn:
+        for statement in COLUMN_UPGRADES:
+            await _with_lock_timeout(conn, statement, lock_timeout, retries)
+            print(f"ok: {statement}")
+
+        for name, table, definition in CONSTRAINT_UPGRADES:
+            async with conn.begin():
+                exists = (await conn.execute(
+                    text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": name}
+                )).scalar_one_or_none()
+            if not exists:
+                await _with_lock_timeout(
+                    conn,
+                    f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID",
+                    lock_timeout,
+                    retries,
+                )
+            async with conn.begin():
+                await conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"))
+            print(f"ok: constraint {name}")
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    async with database.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name, table, columns in INDEX_UPGRADES:
+            invalid = (await conn.execute(
+                text(
+                    "SELECT NOT i.indisvalid FROM pg_class c "
+                    "JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"
+                ),
+                {"name": name},
+            )).scalar_one_or_none()
+            if invalid:
+                print(f"dropping invalid index {name}")
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            started = time.monotonic()
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+            print(f"ok: index {name} ({time.monotonic() - started:.1f}s)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lock-timeout", type=float, default=5)
+    parser.add_argument("--retries", type=int, default=20)
+    args = parser.parse_args()
+
+    await migrate(args.lock_timeout, args.retries)
+    print("done")
+    await Database().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import func, select, text, union_all, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.sql_alchemy import Database
+from src.db.models import (
+    LinkModel,
+    LinkClickModel,
+    LinkClickMinuteModel,
+    LinkClickHourModel,
+    LinkClickDayModel,
+)
+
+database = Database()
+
+# Bucket tables by the interval of their series
+BUCKET_MODELS = {"hour": LinkClickHourModel, "day": LinkClickDayModel}
+
+# Takes pg_try_advisory_xact_lock, so one rollup runs at a time across all workers
+ROLLUP_LOCK_KEY = 7262001
+
+# Codes are resolved to link ids here, so the redirect path never needs the id.
+# Rows are locked in link_id order, so workers flushing at the same time cannot deadlock
+_ADD_CLICKS = text("""
+WITH counted AS (
+    SELECT l.id AS link_id, c.clicks
+    FROM unnest(CAST(:codes AS VARCHAR[]), CAST(:counts AS BIGINT[])) AS c (short_code, clicks)
+    JOIN links l ON l.short_code = c.short_code
+), totals AS (
+    INSERT INTO link_clicks (link_id, clicks, created_at, updated_at)
+    SELECT link_id, clicks, :now, :now FROM counted ORDER BY link_id
+    ON CONFLICT (link_id) DO UPDATE
+    SET clicks = link_clicks.clicks + excluded.clicks, updated_at = excluded.updated_at
+)
+INSERT INTO link_clicks_minute (link_id, bucket, clicks)
+SELECT link_id, date_trunc('minute', CAST(:now AS TIMESTAMP)), clicks FROM counted ORDER BY link_id
+ON CONFLICT (link_id, bucket) DO UPDATE
+SET clicks = link_clicks_minute.clicks + excluded.clicks
+""")
+
+# Minutes are deleted in the statement that adds them to their hour and day,
+# so each is counted exactly once even if the rollup is interrupted or repeated
+_ROLLUP = text("""
+WITH moved AS (
+    DELETE FROM link_clicks_minute WHERE bucket < :before
+    RETURNING link_id, bucket, clicks
+), hours AS (
+    INSERT INTO link_clicks_hour (link_id, bucket, clicks)
+    SELECT link_id, date_trunc('hour', bucket), sum(clicks) FROM moved
+    GROUP BY 1, 2 ORDER BY 1, 2
+    ON CONFLICT (link_id, bucket) DO UPDATE
+    SET clicks = link_clicks_hour.clicks + excluded.clicks
+)
+INSERT INTO link_clicks_day (link_id, bucket, clicks)
+SELECT link_id, date_trunc('day', bucket), sum(clicks) FROM moved
+GROUP BY 1, 2 ORDER BY 1, 2
+ON CONFLICT (link_id, bucket) DO UPDATE
+SET clicks = link_clicks_day.clicks + excluded.clicks
+""")
+
+
+class ClickRepository:
+    async def add_clicks(self, db: AsyncSession, counts: Dict[str, int], now: datetime) -> None:
+        """
+        Add ``counts`` (short code -> clicks) to the link totals and to the
+        minute bucket of ``now``, in one statement.
+        """
+        await db.execute(
+            _ADD_CLICKS, {"codes": list(counts), "counts": list(counts.values()), "now": now}
+        )
+        await db.commit()
+
+    async def rollup(self, db: AsyncSession, before: datetime, purge_hours_before: datetime) -> bool:
+        """
+        Move minute buckets older than ``before`` into hour and day buckets
+        and drop hour buckets older than ``purge_hours_before``. Returns
+        False without doing anything if another rollup is running.
+        """
+        res = await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+        if not res.scalar_one():
+            await db.rollback()
+            return False
+        await db.execute(_ROLLUP, {"before": before})
+        await db.execute(
+            delete(LinkClickHourModel).where(LinkClickHourModel.bucket < purge_hours_before)
+        )
+        await db.commit()
+        return True
+
+    async def get_total(self, db: AsyncSession, link_id: int) -> int:
+        # stats reads go to the replica when there is one
+        res = await database.read(
+            db, select(LinkClickModel.clicks).where(LinkClickModel.link_id == link_id)
+        )
+        return res.scalar_one_or_none() or 0
+
+    async def hot_redirects(self, db: AsyncSession, since: datetime, limit: int) -> List[tuple]:
+        """
+        (short_code, original_url, destination_url, redirect_status) of the
+        ``limit`` links with the most clicks since ``since``, most clicked first.
+        """
+        minute, hour = LinkClickMinuteModel, LinkClickHourModel
+        recent = union_all(
+            select(minute.link_id, minute.clicks).where(minute.bucket >= since),
+            select(hour.link_id, hour.clicks).where(hour.bucket >= since),
+        ).subquery()
+        hot = (
+            select(recent.c.link_id, func.sum(recent.c.clicks).label("clicks"))
+            .group_by(recent.c.link_id)
+            .order_by(func.sum(recent.c.clicks).desc())
+            .limit(limit)
+            .subquery()
+        )
+        res = await db.execute(
+            select(
+                LinkModel.short_code,
+                LinkModel.original_url,
+                LinkModel.destination_url,
+                LinkModel.redirect_status,
+            )
+            .join(hot, hot.c.link_id == LinkModel.id)
+            .order_by(hot.c.clicks.desc())
+        )
+        return list(res.tuples().all())
+
+    async def series(
+        self, db: AsyncSession, link_id: int, interval: str, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, int]]:
+        """
+        (bucket, clicks) of the link's non-empty ``interval`` buckets in
+        [start, end), from the bucket table of that interval plus the minutes
+        not rolled up yet.
+        """
+        model = BUCKET_MODELS[interval]
+        minute = LinkClickMinuteModel
+        parts = union_all(
+            select(model.bucket.label("bucket"), model.clicks.label("clicks")).where(
+                model.link_id == link_id, model.bucket >= start, model.bucket < end
+            ),
+            select(
+                func.date_trunc(interval, minute.bucket).label("bucket"),
+                minute.clicks.label("clicks"),
+            ).where(minute.link_id == link_id, minute.bucket >= start, minute.bucket < end),
+        ).subquery()
+        res = await database.read(
+            db,
+            select(parts.c.bucket, func.sum(parts.c.clicks))
+            .group_by(parts.c.bucket)
+            .order_by(parts.c.bucket),
+        )
+        return [(bucket, int(clicks)) for bucket, clicks in res.tuples().all()]
@@ -0,0 +1,81 @@
+from uuid import UUID
+from datetime import datetime
+from typing import Optional, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete
+
+from src.db.models import JobModel
+
+
+class JobRepository:
+    async def get_by_id(self, db: AsyncSession, job_id: UUID) -> Optional[JobModel]:
+        res = await db.execute(
+            select(JobModel).where(
+                JobModel.id == job_id,
+                JobModel.expires_at > datetime.utcnow(),
+            )
+        )
+        return res.scalar_one_or_none()
+
+    async def list_pending_ids(
+        self, db: AsyncSession, limit: int, waiting_since: Optional[datetime] = None
+    ) -> List[UUID]:
+        """Pending jobs, oldest first; only those not touched since ``waiting_since`` if given."""
+        stmt = select(JobModel.id).where(
+            JobModel.status == "pending", JobModel.expires_at > datetime.utcnow()
+        )
+        if waiting_since is not None:
+            stmt = stmt.where(JobModel.updated_at < waiting_since)
+        res = await db.execute(stmt.order_by(JobModel.created_at).limit(limit))
+        return list(res.scalars().all())
+
+    async def reset_stale(self, db: AsyncSession, before: datetime) -> int:
+        """Put running jobs without a heartbeat since ``before`` back to pending."""
+        # updated_at is kept, so the jobs count as waiting and any worker picks them up
+        res = await db.execute(
+            update(JobModel)
+            .where(JobModel.status == "running", JobModel.updated_at < before)
+            .values(status="pending", updated_at=JobModel.updated_at)
+        )
+        await db.commit()
+        return res.rowcount
+
+    async def touch(self, db: AsyncSession, job_id: UUID) -> None:
+        await db.execute(
+            update(JobModel)
+            .where(JobModel.id == job_id, JobModel.status == "running")
+            .values(updated_at=datetime.utcnow())
+        )
+        await db.commit()
+
+    async def create(self, db: AsyncSession, job: JobModel) -> JobModel:
+        db.add(job)
+        await db.commit()
+        return job
+
+    async def claim(self, db: AsyncSession, job_id: UUID) -> Optional[JobModel]:
+        # only one worker, in any process, can move a job out of pending
+        res = await db.execute(
+            update(JobModel)
+            .where(JobModel.id == job_id, JobModel.status == "pending")
+            .values(status="running", updated_at=datetime.utcnow())
+            .returning(JobModel)
+        )
+        job = res.scalar_one_or_none()
+        await db.commit()
+        return job
+
+    async def finish(self, db: AsyncSession, job_id: UUID, new_values: dict) -> None:
+        await db.execute(
+            update(JobModel)
+            .where(JobModel.id == job_id)
+            .values(updated_at=datetime.utcnow(), **new_values)
+        )
+        await db.commit()
+
+    async def delete_expired(self, db: AsyncSession) -> int:
+        res = await db.execute(
+            delete(JobModel).where(JobModel.expires_at <= datetime.utcnow())
+        )
+        await db.commit()
+        return res.rowcount
@@ -1,46 +1,339 @@
-from typing import Optional, List
+import os
+from uuid import UUID
+from datetime import datetime
+from typing import Optional, List, AsyncIterator, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, text, literal, or_
+from sqlalchemy.dialects.postgresql import insert
 
-from src.db.models import LinkModel
+from src.db.models import LinkModel, LinkTombstoneModel
+from src.db.sql_alchemy import Database
+from src.share.single_flight import SingleFlight
+
+database = Database()
+
+BULK_CHUNK_SIZE = int(os.environ.get("LINK_BULK_CHUNK_SIZE", 1000))
+
+# Columns written by exports, in output order
+EXPORT_COLUMNS = (
+    LinkModel.id,
+    LinkModel.short_code,
+    LinkModel.original_url,
+    LinkModel.destination_url,
+    LinkModel.redirect_status,
+    LinkModel.created_at,
+    LinkModel.updated_at,
+)
+
+# Only the columns a redirect needs; run as a raw asyncpg prepared statement
+_REDIRECT_SQL = (
+    "SELECT original_url, destination_url, redirect_status FROM links WHERE short_code = $1"
+)
+
+
+class RedirectRecord:
+    """The columns of a link a redirect needs, without ORM instrumentation."""
+
+    __slots__ = ("original_url", "destination_url", "redirect_status")
+
+    def __init__(self, original_url: str, destination_url: Optional[str], redirect_status: Optional[int]):
+        self.original_url = original_url
+        self.destination_url = destination_url
+        self.redirect_status = redirect_status
+
+
+# Concurrent misses for the same code share one lookup
+_redirect_flights: SingleFlight[Optional[RedirectRecord]] = SingleFlight()
+
+
+def _tombstone(rows):
+    # a code that is deleted again, or renamed away again, keeps its latest time
+    stmt = insert(LinkTombstoneModel).from_select(["short_code", "deleted_at"], rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[LinkTombstoneModel.short_code],
+        set_={"deleted_at": stmt.excluded.deleted_at},
+    )
+
+
+def _pin(link_id=None, code=None, user_id=None) -> None:
+    # reads of what was just written go to the primary until the replica has caught up
+    keys = []
+    if link_id is not None:
+        keys.append(f"link:{link_id}")
+    if code is not None:
+        keys.append(f"code:{code}")
+    if user_id is not None:
+        keys.append(f"user:{user_id}")
+    database.pin(*keys)
+
+
+def pin_code(code: str) -> None:
+    # for codes written by other workers, announced through invalidations
+    _pin(code=code)
 
 
 class LinkRepository:
     async def get_by_id(self, db: AsyncSession, link_id: int) -> Optional[LinkModel]:
-        res = await db.execute(
-            select(LinkModel).where(LinkModel.id == link_id)
+        res = await database.read(
+            db, select(LinkModel).where(LinkModel.id == link_id), [f"link:{link_id}"]
         )
         return res.scalar_one_or_none()
 
     async def get_by_code(self, db: AsyncSession, code: str) -> Optional[LinkModel]:
+        res = await database.read(
+            db, select(LinkModel).where(LinkModel.short_code == code), [f"code:{code}"]
+        )
+        return res.scalar_one_or_none()
+
+    async def get_redirect(self, db: AsyncSession, code: str) -> Optional[RedirectRecord]:
+        keys = [f"code:{code}"]
+
+        async def fetch() -> Optional[RedirectRecord]:
+            row = await database.fetchrow(db, _REDIRECT_SQL, code, keys=keys)
+            if row is None:
+                return None
+            return RedirectRecord(row[0], row[1], row[2])
+
+        # callers that must read the primary do not share a replica read, and vice versa
+        return await _redirect_flights.do((code, database.reads_primary(db, keys)), fetch)
+
+    async def get_by_url_hash(
+        self, db: AsyncSession, url_hash: bytes, user_id: Optional[UUID] = None
+    ) -> Optional[LinkModel]:
         res = await db.execute(
-            select(LinkModel).where(LinkModel.short_code == code)
+            select(LinkModel)
+            .where(
+                LinkModel.url_hash == url_hash,
+                LinkModel.user_id.is_not_distinct_from(user_id),
+            )
+            .order_by(LinkModel.id)
+            .limit(1)
         )
         return res.scalar_one_or_none()
 
-    async def list(self, db: AsyncSession, user_id: Optional[str] = None) -> List[LinkModel]:
-        stmt = select(LinkModel)
-        if user_id:
-            stmt = stmt.where(LinkModel.user_id == user_id)
-        res = await db.execute(stmt)
+    async def get_codes_by_url_hashes(
+        self, db: AsyncSession, url_hashes: List[bytes], user_id: Optional[UUID] = None
+    ) -> dict:
+        """Map each known url hash to the (id, short_code) of its oldest link."""
+        found = {}
+        for start in range(0, len(url_hashes), BULK_CHUNK_SIZE):
+            res = await db.execute(
+                select(LinkModel.url_hash, LinkModel.id, LinkModel.short_code)
+                .distinct(LinkModel.url_hash)
+                .where(
+                    LinkModel.url_hash.in_(url_hashes[start:start + BULK_CHUNK_SIZE]),
+                    LinkModel.user_id.is_not_distinct_from(user_id),
+                )
+                .order_by(LinkModel.url_hash, LinkModel.id)
+            )
+            for url_hash, link_id, code in res.tuples():
+                found[url_hash] = (link_id, code)
+        return found
+
+    async def list(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        limit: int,
+        after_id: int = 0,
+    ) -> List[LinkModel]:
+        # keyset pagination on (user_id, id), so every page is one index range scan
+        res = await database.read(
+            db,
+            select(LinkModel)
+            .where(LinkModel.user_id == user_id, LinkModel.id > after_id)
+            .order_by(LinkModel.id)
+            .limit(limit),
+            [f"user:{user_id}"],
+        )
+        return list(res.scalars().all())
+
+    async def stream_rows(
+        self, db: AsyncSession, user_id: UUID, batch_size: int, include_unowned: bool = False
+    ) -> AsyncIterator[Sequence[tuple]]:
+        """
+        Yield the user's links, plus the links without an owner if
+        ``include_unowned``, as plain row tuples, ``batch_size`` at a time,
+        from a server-side cursor, so no more than one batch is held in memory.
+        """
+        owned = LinkModel.user_id == user_id
+        res = await db.stream(
+            select(*EXPORT_COLUMNS)
+            .where(or_(owned, LinkModel.user_id.is_(None)) if include_unowned else owned)
+            .order_by(LinkModel.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for rows in res.tuples().partitions():
+            yield rows
+
+    async def stream_codes(
+        self, db: AsyncSession, batch_size: int, since: Optional[datetime] = None
+    ) -> AsyncIterator[Sequence[str]]:
+        """All short codes, or those written since ``since``, in batches from a server-side cursor."""
+        stmt = select(LinkModel.short_code)
+        if since is not None:
+            stmt = stmt.where(LinkModel.updated_at >= since)
+        res = await db.stream(stmt.execution_options(yield_per=batch_size))
+        async for codes in res.scalars().partitions():
+            yield codes
+
+    async def stream_redirects(
+        self, db: AsyncSession, batch_size: int, since: Optional[datetime] = None
+    ) -> AsyncIterator[Sequence[tuple]]:
+        """
+        (short_code, original_url, destination_url, redirect_status) of all links,
+        or those written since ``since``, in byte order of short_code.
+        """
+        stmt = select(
+            LinkModel.short_code,
+            LinkModel.original_url,
+            LinkModel.destination_url,
+            LinkModel.redirect_status,
+        )
+        if since is not None:
+            stmt = stmt.where(LinkModel.updated_at >= since)
+        # byte order whatever the database collation, as snapshot files are searched bytewise
+        res = await db.stream(
+            stmt.order_by(LinkModel.short_code.collate("C")).execution_options(yield_per=batch_size)
+        )
+        async for rows in res.tuples().partitions():
+            yield rows
+
+    async def deleted_codes(self, db: AsyncSession, since: datetime) -> List[str]:
+        """Codes deleted or renamed away since ``since`` that no link uses now, in byte order."""
+        res = await db.execute(
+            select(LinkTombstoneModel.short_code)
+            .outerjoin(LinkModel, LinkModel.short_code == LinkTombstoneModel.short_code)
+            .where(LinkTombstoneModel.deleted_at >= since, LinkModel.id.is_(None))
+            .order_by(LinkTombstoneModel.short_code.collate("C"))
+        )
         return list(res.scalars().all())
 
-    async def create(self, db: AsyncSession, link: LinkModel) -> LinkModel:
-        db.add(link)
+    async def purge_tombstones(self, db: AsyncSession, before: datetime) -> int:
+        res = await db.execute(
+            delete(LinkTombstoneModel).where(LinkTombstoneModel.deleted_at < before)
+        )
         await db.commit()
-        await db.refresh(link)
+        return res.rowcount
+
+    async def recent_redirects(self, db: AsyncSession, limit: int) -> List[tuple]:
+        """(short_code, original_url, destination_url, redirect_status) of the most recently written links."""
+        res = await db.execute(
+            select(
+                LinkModel.short_code,
+                LinkModel.original_url,
+                LinkModel.destination_url,
+                LinkModel.redirect_status,
+            )
+            .order_by(LinkModel.updated_at.desc())
+            .limit(limit)
+        )
+        return list(res.tuples().all())
+
+    async def estimate_count(self, db: AsyncSession) -> int:
+        # planner statistics instead of count(*), which scans the whole table
+        res = await db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+            {"table": LinkModel.__tablename__},
+        )
+        return max(res.scalar_one_or_none() or 0, 0)
+
+    async def reserve_ids(self, db: AsyncSession, count: int) -> List[int]:
+        # nextval is never rolled back, so reserved ids are unique across all workers and hosts
+        res = await db.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                "FROM generate_series(1, :count)"
+            ),
+            {"table": LinkModel.__tablename__, "count": count},
+        )
+        return list(res.scalars().all())
+
+    async def create(self, db: AsyncSession, values: dict) -> Optional[LinkModel]:
+        # single round trip; returns None instead of raising when the short code is taken.
+        # The caller commits
+        res = await db.execute(
+            insert(LinkModel)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=[LinkModel.short_code])
+            .returning(LinkModel)
+        )
+        link = res.scalar_one_or_none()
+        if link:
+            _pin(link.id, link.short_code, link.user_id)
         return link
 
-    async def update(self, db: AsyncSession, link_id: int, new_values: dict) -> Optional[LinkModel]:
-        await db.execute(
-            update(LinkModel)
+    async def create_many(self, db: AsyncSession, rows: List[dict]) -> List[tuple]:
+        """
+        Insert rows with chunked multi-row statements, skipping rows whose short
+        code is taken. Returns (id, short_code) of inserted rows; the caller commits.
+        """
+        table = LinkModel.__table__
+
+        # a multi-row VALUES clause takes its columns from the first row, so
+        # rows with different keys (e.g. with and without an explicit id) go in separate statements
+        groups: dict = {}
+        for row in rows:
+            groups.setdefault(frozenset(row), []).append(row)
+
+        inserted = []
+        for group in groups.values():
+            for start in range(0, len(group), BULK_CHUNK_SIZE):
+                res = await db.execute(
+                    insert(table)
+                    .values(group[start:start + BULK_CHUNK_SIZE])
+                    .on_conflict_do_nothing(index_elements=[table.c.short_code])
+                    .returning(table.c.id, table.c.short_code)
+                )
+                inserted.extend(res.tuples().all())
+        for link_id, code in inserted:
+            _pin(link_id, code)
+        _pin(user_id=rows[0].get("user_id") if rows else None)
+        return inserted
+
+    async def update(
+        self, db: AsyncSession, link_id: int, new_values: dict
+    ) -> Optional[Tuple[LinkModel, str]]:
+        """
+        The updated link and the short code it had before, or None if there
+        is no such link. The caller commits.
+        """
+        if "short_code" in new_values:
+            # the old code, if it changes, in the same transaction as the rename
+            await db.execute(_tombstone(
+                select(LinkModel.short_code, literal(datetime.utcnow()))
+                .where(LinkModel.id == link_id, LinkModel.short_code != new_values["short_code"])
+            ))
+        # the pre-update code comes from the row being updated, never from a possibly lagging replica
+        old = (
+            select(LinkModel.id, LinkModel.short_code)
             .where(LinkModel.id == link_id)
+            .with_for_update()
+            .subquery("old")
+        )
+        res = await db.execute(
+            update(LinkModel)
+            .where(LinkModel.id == old.c.id)
             .values(**new_values)
+            .returning(LinkModel, old.c.short_code)
+            .execution_options(synchronize_session=False)
         )
-        await db.commit()
-        # return the updated link
-        return await self.get_by_id(db, link_id)
+        row = res.one_or_none()
+        if row is None:
+            return None
+        link, old_code = row
+        _pin(link_id, link.short_code, link.user_id)
+        return link, old_code
 
-    async def delete(self, db: AsyncSession, link_id: int) -> None:
-        await db.execute(delete(LinkModel).where(LinkModel.id == link_id))
-        await db.commit()
+    async def delete(self, db: AsyncSession, link_id: int) -> Optional[str]:
+        # return the short code of the deleted link so callers can invalidate caches; the caller commits
+        res = await db.execute(
+            delete(LinkModel)
+            .where(LinkModel.id == link_id)
+            .returning(LinkModel.short_code)
+        )
+        code = res.scalar_one_or_none()
+        if code is not None:
+            await db.execute(_tombstone(select(literal(code), literal(datetime.utcnow()))))
+        _pin(link_id, code)
+        return code
@@ -0,0 +1,101 @@
+import json
+from urllib.parse import quote
+from typing import Iterable, Optional
+
+from src.db.sql_alchemy import Database
+from src.share.logging import Logging
+from src.util.env import env_bool
+from src.link.services.link_service import LinkService
+from src.link.services.click_counter import ClickCounter
+
+# Serve GET /l/{short_code} from FastRedirectMiddleware instead of the FastAPI route
+FAST_REDIRECT_ENABLED = env_bool("LINK_FAST_REDIRECT", "false")
+
+PREFIX = "/l/"
+
+database = Database()
+service = LinkService()
+clicks = ClickCounter()
+_logger = Logging().get_logger()
+
+_NOT_FOUND = json.dumps({"detail": "Link not found"}, separators=(",", ":")).encode()
+_ERROR = json.dumps(
+    {"detail": "An error occurred while processing your request"}, separators=(",", ":")
+).encode()
+
+
+class FastRedirectMiddleware:
+    """
+    Answers redirects before CORS, routing and dependency injection run.
+
+    Same responses as the GET /l/{short_code} route: the stored 301/307
+    with a Location header, or a 404 with the usual JSON body. A database
+    session is only opened when the code is not in the redirect cache.
+    Everything else, including single segment paths the router serves
+    itself (``reserved``), is passed on to the app.
+    """
+
+    def __init__(self, app, reserved: Iterable[str] = ()) -> None:
+        self.app = app
+        self.reserved = frozenset(reserved)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["method"] == "GET":
+            path = scope["path"]
+            if path.startswith(PREFIX):
+                code = path[len(PREFIX):]
+                if code and "/" not in code and code not in self.reserved:
+                    await self._redirect(scope, code, send)
+                    return
+        await self.app(scope, receive, send)
+
+    async def _redirect(self, scope, code: str, send) -> None:
+        try:
+            target = service.cached_redirect(code)
+            if target is None:
+                async with database.SessionLocal() as db:
+                    target = await service.resolve_redirect(db, code)
+        except Exception as e:
+            _logger.error(f"[GET] {code} - redirect failed: {str(e)}")
+            await _send(send, scope, 500, _ERROR)
+            return
+
+        if target is None:
+            _logger.error(f"[GET] {scope['path']} - 404 - Link not found")
+            await _send(send, scope, 404, _NOT_FOUND)
+            return
+
+        clicks.record(code)
+        url, status = target
+        # quoted like starlette's RedirectResponse
+        location = quote(url, safe=":/%#?=@[]!$&'()*+,;")
+        await _send(send, scope, status, b"", location)
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+async def _send(send, scope, status: int, body: bytes, location: Optional[str] = None) -> None:
+    headers = [(b"content-length", str(len(body)).encode())]
+    if body:
+        headers.append((b"content-type", b"application/json"))
+    if location is not None:
+        headers.append((b"location", location.encode("latin-1", errors="replace")))
+
+    # what CORSMiddleware (any origin, with credentials) adds to simple requests:
+    # any origin, except that a request with cookies gets its own origin back
+    origin = _header(scope, b"origin")
+    if origin is not None:
+        if _header(scope, b"cookie") is not None:
+            headers.append((b"access-control-allow-origin", origin))
+            headers.append((b"vary", b"Origin"))
+        else:
+            headers.append((b"access-control-allow-origin", b"*"))
+        headers.append((b"access-control-allow-credentials", b"true"))
+
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
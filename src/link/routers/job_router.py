@@ -0,0 +1,116 @@
+from uuid import UUID
+from datetime import datetime
+from typing import Optional, List, Any
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from src.db.sql_alchemy import Database
+from src.util.exceptions import NotFoundError, RateLimitError
+from src.auth.utils.get_token import authenticate_user
+from src.link.services.job_service import JobService
+from src.link.routers.link_router import LinkBulkCreateInput
+from src.util.response import global_response, GlobalResponse
+
+router = APIRouter(prefix="/l/jobs")
+database = Database()
+service = JobService()
+
+
+async def get_db() -> AsyncSession:
+    async for db in database.get_db():
+        yield db
+
+
+class ProcessTextJobInput(BaseModel):
+    documents: List[str] = Field(..., description="Texts containing URLs to be shortened")
+    base_url: str = Field("http://localhost:8005", description="Base URL for short links")
+
+
+class JobOutput(BaseModel):
+    id: UUID
+    kind: str
+    status: str = Field(..., description="pending, running, succeeded or failed")
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    expires_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class JobResultOutput(JobOutput):
+    result: Optional[Any] = None
+
+
+def _job_output(job, with_result: bool = False) -> dict:
+    output = JobResultOutput if with_result else JobOutput
+    return output.model_validate(job).model_dump()
+
+
+async def _submit(db: AsyncSession, user_id: str, kind: str, payload: dict):
+    try:
+        job = await service.submit(db, user_id, kind, payload)
+    except RateLimitError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return global_response(_job_output(job), status_code=status.HTTP_202_ACCEPTED)
+
+
+@router.post(
+    "/process-text",
+    response_model=GlobalResponse[JobOutput, dict],
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def submit_process_text_job(
+    input: ProcessTextJobInput,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    """
+    Queue a batch of documents for process-text and return the job right away.
+
+    Poll `GET /l/jobs/{job_id}` for its status and fetch the rewritten
+    documents from `GET /l/jobs/{job_id}/result` once it has succeeded.
+    """
+    return await _submit(db, user_id, "process-text", input.model_dump())
+
+
+@router.post(
+    "/bulk",
+    response_model=GlobalResponse[JobOutput, dict],
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def submit_bulk_job(
+    input: LinkBulkCreateInput,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    """Queue a bulk link creation and return the job right away."""
+    return await _submit(db, user_id, "bulk", input.model_dump())
+
+
+@router.get("/{job_id}", response_model=GlobalResponse[JobOutput, dict])
+async def get_job(
+    job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    try:
+        job = await service.get_job(db, job_id, user_id)
+        return global_response(_job_output(job))
+    except NotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get("/{job_id}/result", response_model=GlobalResponse[JobResultOutput, dict])
+async def get_job_result(
+    job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    try:
+        job = await service.get_job(db, job_id, user_id)
+        return global_response(_job_output(job, with_result=True))
+    except NotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
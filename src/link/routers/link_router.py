@@ -1,19 +1,52 @@
-import re
-from urlextract import URLExtract
-from typing import Optional, List, Dict
-from pydantic import BaseModel, Field, HttpUrl
-from fastapi.responses import RedirectResponse
+import io
+import os
+import csv
+import json
+import anyio
+import codecs
+from datetime import datetime
+from uuid import UUID
+from typing import Optional, List, Dict, AsyncIterator, Literal
+from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 
 from src.db.sql_alchemy import Database
 from src.auth.utils.get_token import authenticate_user
-from src.link.services.link_service import LinkService
+from src.share.cache import TTLCache
+from src.share.logging import Logging
+from src.link.services.link_service import EXPORT_FIELDS, LinkService
+from src.link.services.click_counter import ClickCounter
+from src.link.utils.url_extractor import (
+    extract_url_spans_async,
+    last_split_point,
+    rewrite_spans,
+)
+from src.util.exceptions import NotFoundError
 from src.util.response import global_response, GlobalResponse
 
 router = APIRouter(prefix="/l")
 database = Database()
+_logger = Logging().get_logger()
 service = LinkService()
+clicks = ClickCounter()
+
+BULK_MAX_ITEMS = int(os.environ.get("LINK_BULK_MAX_ITEMS", 50000))
+
+LIST_PAGE_SIZE = int(os.environ.get("LINK_LIST_PAGE_SIZE", 50))
+LIST_MAX_PAGE_SIZE = int(os.environ.get("LINK_LIST_MAX_PAGE_SIZE", 500))
+
+# Rows fetched from the server-side cursor per round trip while exporting
+EXPORT_BATCH_SIZE = int(os.environ.get("LINK_EXPORT_BATCH_SIZE", 1000))
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Streaming process-text: text is shortened in segments of about this many characters
+STREAM_SEGMENT_CHARS = int(os.environ.get("PROCESS_TEXT_STREAM_SEGMENT_CHARS", 64 * 1024))
+# A segment without any whitespace is cut anyway past this size to keep memory bounded
+STREAM_MAX_SEGMENT_CHARS = STREAM_SEGMENT_CHARS * 16
+# URLs already shortened in the current stream, so repeats reuse the same short link
+STREAM_TRACKED_URLS = int(os.environ.get("PROCESS_TEXT_STREAM_TRACKED_URLS", 10000))
 
 
 async def get_db() -> AsyncSession:
@@ -26,6 +59,17 @@ class LinkCreateInput(BaseModel):
     preferred_code: Optional[str] = Field(None, description="Optional preferred short code")
 
 
+class LinkBulkCreateInput(BaseModel):
+    items: List[LinkCreateInput] = Field(..., max_length=BULK_MAX_ITEMS)
+
+
+class LinkBulkItemOutput(BaseModel):
+    original_url: str
+    id: Optional[int] = None
+    short_code: Optional[str] = None
+    error: Optional[str] = Field(None, description="Why this item was not created")
+
+
 class LinkUpdateInput(BaseModel):
     original_url: Optional[str] = None
     short_code: Optional[str] = None
@@ -35,12 +79,32 @@ class LinkOutput(BaseModel):
     id: int
     original_url: str
     short_code: str
-    user_id: Optional[str] = None
+    user_id: Optional[UUID] = None
 
     class Config:
         from_attributes = True
 
 
+def _link_output(link) -> dict:
+    # only the public columns; url_hash is binary and not JSON serializable
+    return LinkOutput.model_validate(link).model_dump()
+
+
+class ClickBucketOutput(BaseModel):
+    bucket: datetime = Field(..., description="Start of the bucket, UTC")
+    clicks: int
+
+
+class LinkStatsOutput(BaseModel):
+    link_id: int
+    interval: str
+    start: datetime
+    end: datetime
+    clicks: int = Field(..., description="Clicks between start and end")
+    total_clicks: int = Field(..., description="Clicks since the link was created")
+    series: List[ClickBucketOutput] = Field(..., description="Buckets with clicks, oldest first")
+
+
 class TextProcessInput(BaseModel):
     text: str = Field(..., description="Text containing URLs to be shortened")
     base_url: str = Field("http://localhost:8005", description="Base URL for short links")
@@ -62,32 +126,122 @@ async def create_link(
 ):
     try:
         link = await service.create_link(
-            db, original_url=input.original_url, preferred_code=input.preferred_code
+            db,
+            original_url=input.original_url,
+            preferred_code=input.preferred_code,
+            user_id=user_id,
         )
-        return global_response(link)
+        return global_response(_link_output(link))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
+@router.post("/bulk", response_model=GlobalResponse[List[LinkBulkItemOutput], dict])
+async def create_links_bulk(
+    input: LinkBulkCreateInput,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    """
+    Create many links in one transaction.
+
+    Results are returned in input order; items whose preferred code is taken
+    carry an error instead of failing the whole request.
+    """
+    results = await service.create_links_bulk(
+        db, [(item.original_url, item.preferred_code) for item in input.items], user_id
+    )
+    return global_response(results)
+
+
+@router.get("/stats/cache", response_model=GlobalResponse[dict, dict])
+async def get_cache_stats(user_id: str = Depends(authenticate_user)):
+    return global_response(service.cache_stats())
+
+
+@router.get("/{link_id}/stats", response_model=GlobalResponse[LinkStatsOutput, dict])
+async def get_link_stats(
+    link_id: int,
+    interval: Literal["hour", "day"] = Query("day"),
+    start: Optional[datetime] = Query(None, description="Defaults to 24 hours (hour) or 30 days (day) before end"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    try:
+        stats = await service.get_click_stats(db, link_id, user_id, interval, start, end)
+        return global_response(stats)
+    except NotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _ndjson_batch(rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, map(_export_value, row)))) + "\n"
+        for row in rows
+    )
+
+
+def _csv_batch(rows, header: bool = False) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows([_export_value(value) for value in row] for row in rows)
+    return out.getvalue()
+
+
+async def _stream_export(user_id: str, format: str, include_unowned: bool) -> AsyncIterator[str]:
+    if format == "csv":
+        yield _csv_batch([], header=True)
+
+    # dependency sessions are closed before a streaming body runs, so the stream owns its own
+    async with database.SessionLocal() as db:
+        async for rows in service.export_links(db, user_id, EXPORT_BATCH_SIZE, include_unowned):
+            yield _csv_batch(rows) if format == "csv" else _ndjson_batch(rows)
+
+
+@router.get("/export")
+async def export_links(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_unowned: bool = False,
+    user_id: str = Depends(authenticate_user),
+):
+    """
+    Stream all of the caller's links as NDJSON (one object per line) or CSV.
+
+    Links created before ownership was recorded have no owner, so they are
+    in no one's export; pass ``include_unowned=true`` to add them, e.g. to
+    dump every link for reporting.
+
+    Rows are read from a server-side cursor in batches and written out as
+    they arrive, so exports of any size run in constant memory.
+    """
+    return StreamingResponse(
+        _stream_export(user_id, format, include_unowned),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="links.{format}"'},
+    )
+
+
 @router.get("/{short_code}", response_model=GlobalResponse[LinkOutput, dict])
 async def get_link(short_code: str, db: AsyncSession = Depends(get_db)):
     try:
-        link = await service.get_by_code(db, short_code)
-        if not link:
+        target = await service.resolve_redirect(db, short_code)
+        if not target:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Link not found"
             )
-        
-        # Ensure the URL has a scheme
-        original_url = link.original_url
-        if not (original_url.startswith('http://') or original_url.startswith('https://')):
-            original_url = f'http://{original_url}'
-            
-        # Use permanent redirect for images, temporary redirect for other URLs
-        is_image = any(original_url.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp'])
-        redirect_status = status.HTTP_301_MOVED_PERMANENTLY if is_image else status.HTTP_307_TEMPORARY_REDIRECT
-            
+
+        clicks.record(short_code)
+        original_url, redirect_status = target
         return RedirectResponse(
             url=original_url,
             status_code=redirect_status
@@ -102,17 +256,26 @@ async def get_link(short_code: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("", response_model=GlobalResponse[List[LinkOutput], dict])
-async def list_links(db: AsyncSession = Depends(get_db), user_id: Optional[str] = None):
-    links = await service.list_links(db)
-    return global_response(links)
-
-
-def _extract_urls(text: str) -> List[str]:
-    """Extract all URLs from the given text."""
+async def list_links(
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(authenticate_user),
+):
+    """
+    List the caller's links, oldest first, one page at a time.
 
-    extractor = URLExtract()
-    urls = extractor.find_urls(text)
-    return urls
+    Pass `metadata.next_cursor` back as `cursor` to get the next page; it is
+    null on the last page.
+    """
+    try:
+        links, next_cursor = await service.list_links(db, user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return global_response(
+        [_link_output(link) for link in links],
+        metadata={"next_cursor": next_cursor},
+    )
 
 
 @router.post(
@@ -133,39 +296,9 @@ async def process_text(
     of original to shortened URLs.
     """
     try:
-        urls = _extract_urls(input.text)
-        if not urls:
-            return global_response(ProcessedTextOutput(
-                processed_text=input.text,
-                shortened_links={}
-            ))
-
-        shortened_links = {}
-        processed_text = input.text
-
-        for url in set(urls):  # Use set to process each unique URL only once
-
-            # skip already shortened links
-            if "acecrm.ca" in url:
-                continue
-            
-            try:
-                # Create short link
-                link = await service.create_link(
-                    db,
-                    original_url=url,
-                    preferred_code=None
-                )
-                # Build the shortened URL
-                short_url = f"{input.base_url}/l/{link.short_code}"
-                shortened_links[url] = short_url
-                # Replace all occurrences of this URL in the text
-                processed_text = processed_text.replace(url, short_url)
-            except Exception as e:
-                # If shortening fails for a URL, keep the original
-                print(f"Failed to shorten URL {url}: {str(e)}")
-                continue
-
+        processed_text, shortened_links = await service.process_text(
+            db, input.text, input.base_url, user_id
+        )
         return global_response(ProcessedTextOutput(
             processed_text=processed_text,
             shortened_links=shortened_links
@@ -179,6 +312,105 @@ async def process_text(
         )
 
 
+class _RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for bodies produced while the request body is still
+    being read. The stock disconnect listener would consume receive()
+    concurrently with request.stream(); here a disconnect surfaces through
+    request.stream() instead.
+    """
+
+    async def listen_for_disconnect(self, receive) -> None:
+        await anyio.sleep_forever()
+
+
+async def _shorten_segment(
+    db: AsyncSession,
+    segment: str,
+    base_url: str,
+    seen: TTLCache,
+    user_id: str,
+) -> AsyncIterator[str]:
+    # segments run up to STREAM_MAX_SEGMENT_CHARS, so large ones are extracted off the event loop
+    spans = await extract_url_spans_async(segment)
+    new_urls = [
+        url for url in dict.fromkeys(url for url, _, _ in spans)
+        if "acecrm.ca" not in url and seen.get(url) is None
+    ]
+
+    codes = {}
+    if new_urls:
+        try:
+            codes = await service.shorten_urls(db, new_urls, user_id)
+        except Exception as e:
+            # If shortening fails, keep the original text
+            await db.rollback()
+            _logger.error(f"Failed to shorten URLs: {str(e)}")
+
+    for url, code in codes.items():
+        short_url = f"{base_url}/l/{code}"
+        seen.set(url, short_url)
+        yield json.dumps({"type": "link", "original_url": url, "short_url": short_url}) + "\n"
+
+    shortened_links = {}
+    for url, _, _ in spans:
+        short_url = seen.get(url)
+        if short_url is not None:
+            shortened_links[url] = short_url
+    yield json.dumps({"type": "text", "text": rewrite_spans(segment, spans, shortened_links)}) + "\n"
+
+
+async def _stream_processed_text(request: Request, base_url: str, user_id: str) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    seen = TTLCache(max_size=STREAM_TRACKED_URLS, ttl=float("inf"))
+    buffer = ""
+
+    # dependency sessions are closed before a streaming body runs, so the stream owns its own
+    async with database.SessionLocal() as db:
+        try:
+            async for chunk in request.stream():
+                buffer += decoder.decode(chunk)
+                while len(buffer) >= STREAM_SEGMENT_CHARS:
+                    # never cut inside a URL: split at the last whitespace seen so far
+                    cut = last_split_point(buffer)
+                    if cut <= 0:
+                        if len(buffer) < STREAM_MAX_SEGMENT_CHARS:
+                            break
+                        cut = len(buffer)
+                    segment, buffer = buffer[:cut], buffer[cut:]
+                    async for line in _shorten_segment(db, segment, base_url, seen, user_id):
+                        yield line
+
+            buffer += decoder.decode(b"", final=True)
+            if buffer:
+                async for line in _shorten_segment(db, buffer, base_url, seen, user_id):
+                    yield line
+        except Exception as e:
+            _logger.error(f"Error processing text stream: {str(e)}")
+            yield json.dumps({"type": "error", "detail": "An error occurred while processing the text"}) + "\n"
+
+
+@router.post("/process-text/stream", status_code=status.HTTP_200_OK)
+async def process_text_stream(
+    request: Request,
+    base_url: str = "http://localhost:8005",
+    user_id: str = Depends(authenticate_user),
+):
+    """
+    Streaming variant of process-text for very large documents.
+
+    The request body is the raw UTF-8 text. It is read incrementally and
+    shortened segment by segment; the response is NDJSON made of
+    ``{"type": "link", "original_url", "short_url"}`` entries for each newly
+    shortened URL, followed by ``{"type": "text", "text"}`` entries which,
+    concatenated in order, form the rewritten document.
+    """
+    return _RequestStreamingResponse(
+        _stream_processed_text(request, base_url, user_id),
+        media_type="application/x-ndjson",
+    )
+
+
 @router.put("/{link_id}", response_model=GlobalResponse[LinkOutput, dict])
 async def update_link(
     link_id: int,
@@ -188,7 +420,7 @@ async def update_link(
 ):
     try:
         link = await service.update_link(db, link_id, input.original_url, input.short_code)
-        return global_response(link)
+        return global_response(_link_output(link))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
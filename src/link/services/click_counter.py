@@ -0,0 +1,104 @@
+import os
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from src.share.logging import Logging
+from src.db.sql_alchemy import Database
+from src.util.singleton import Singleton
+from src.util.env import env_bool
+from src.link.repositories.click_repository import ClickRepository
+
+CLICKS_ENABLED = env_bool("LINK_CLICKS_ENABLED", "true")
+CLICKS_FLUSH_SECONDS = float(os.environ.get("LINK_CLICKS_FLUSH_SECONDS", 5))
+CLICKS_ROLLUP_SECONDS = float(os.environ.get("LINK_CLICKS_ROLLUP_SECONDS", 60))
+# Hourly series reach back this far; daily series are kept forever
+CLICKS_HOUR_RETENTION_DAYS = int(os.environ.get("LINK_CLICKS_HOUR_RETENTION_DAYS", 90))
+
+database = Database()
+_logger = Logging().get_logger()
+
+
+class ClickCounter(metaclass=Singleton):
+    """
+    Per-worker click counts, written to the database in batches.
+
+    A redirect only increments a dict entry. Every LINK_CLICKS_FLUSH_SECONDS
+    the counts are swapped for an empty dict and added to the link totals
+    and to the current minute bucket with one statement, so a popular link
+    costs one row update per worker and interval instead of one per click.
+    Counts that fail to flush are kept for the next attempt, and what is
+    left is flushed on shutdown. Clicks still in memory when a worker is
+    killed are lost, and clicks are bucketed by when they were flushed.
+
+    Every LINK_CLICKS_ROLLUP_SECONDS one worker moves the minutes of past
+    hours into hour and day buckets and drops hours past their retention.
+    """
+
+    def __init__(self) -> None:
+        self.repository = ClickRepository()
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._tasks: List[asyncio.Task] = []
+        self._flushing = asyncio.Lock()
+
+    def record(self, code: str) -> None:
+        if CLICKS_ENABLED:
+            self._counts[code] += 1
+
+    async def start(self) -> None:
+        if not CLICKS_ENABLED or self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._flush_periodically()),
+            asyncio.create_task(self._rollup_periodically()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+        except Exception as e:
+            _logger.error(f"Flushing click counts on shutdown failed: {str(e)}")
+
+    async def flush(self) -> None:
+        async with self._flushing:
+            if not self._counts:
+                return
+            counts, self._counts = self._counts, defaultdict(int)
+            try:
+                async with database.SessionLocal() as db:
+                    await self.repository.add_clicks(db, counts, datetime.utcnow())
+            except BaseException:
+                # kept for the next flush, together with clicks counted meanwhile
+                for code, clicks in counts.items():
+                    self._counts[code] += clicks
+                raise
+
+    async def rollup(self) -> None:
+        now = datetime.utcnow()
+        async with database.SessionLocal() as db:
+            await self.repository.rollup(
+                db,
+                before=now.replace(minute=0, second=0, microsecond=0),
+                purge_hours_before=now - timedelta(days=CLICKS_HOUR_RETENTION_DAYS),
+            )
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(CLICKS_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                _logger.error(f"Flushing click counts failed: {str(e)}")
+
+    async def _rollup_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(CLICKS_ROLLUP_SECONDS)
+            try:
+                await self.rollup()
+            except Exception as e:
+                _logger.error(f"Rolling up click buckets failed: {str(e)}")
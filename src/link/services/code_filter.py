@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+from typing import List, Optional
+from datetime import datetime, timedelta
+
+from src.share.logging import Logging
+from src.db.sql_alchemy import Database
+from src.util.singleton import Singleton
+from src.util.env import env_bool
+from src.share.bloom_filter import BloomFilter
+from src.link.repositories.link_repository import LinkRepository
+from src.link.services.invalidation import InvalidationListener
+
+BLOOM_ENABLED = env_bool("LINK_BLOOM_ENABLED", "true")
+BLOOM_ERROR_RATE = float(os.environ.get("LINK_BLOOM_ERROR_RATE", 0.01))
+# Room for links created until the next rebuild
+BLOOM_GROWTH = 1.5
+BLOOM_MIN_CAPACITY = int(os.environ.get("LINK_BLOOM_MIN_CAPACITY", 1_000_000))
+BLOOM_REBUILD_SECONDS = int(os.environ.get("LINK_BLOOM_REBUILD_SECONDS", 3600))
+BLOOM_SYNC_SECONDS = float(os.environ.get("LINK_BLOOM_SYNC_SECONDS", 2))
+# Links written by other workers are picked up by re-reading this far back,
+# which must cover clock skew between hosts and the longest write transaction
+BLOOM_SYNC_OVERLAP_SECONDS = int(os.environ.get("LINK_BLOOM_SYNC_OVERLAP_SECONDS", 30))
+BLOOM_SCAN_BATCH_SIZE = 10000
+
+database = Database()
+_logger = Logging().get_logger()
+
+
+class CodeFilter(metaclass=Singleton):
+    """
+    In-process Bloom filter of every existing short code.
+
+    A code the filter does not contain is taken not to exist, so its
+    redirect is answered without a query. The filter is built in the
+    background from a streaming scan and is rebuilt from scratch every
+    LINK_BLOOM_REBUILD_SECONDS to shed deleted codes. Codes written by
+    other workers arrive with their invalidation notification (see add),
+    or with the incremental sync every LINK_BLOOM_SYNC_SECONDS when
+    notifications are disabled; until then they get a 404 here. When the
+    listener reconnects, the next sync re-reads everything written since
+    its old connection was last known to work. Until the filter is built,
+    whenever the last sync is too old, and until that catch-up sync has
+    run, every code is reported as possibly existing.
+    """
+
+    def __init__(self) -> None:
+        self.repository = LinkRepository()
+        self._filter: Optional[BloomFilter] = None
+        # filter being rebuilt; receives the same adds as the live one
+        self._building: Optional[BloomFilter] = None
+        self._synced_at = 0.0
+        # wall clock time notifications may have been missed from, until a sync covers it
+        self._missed_since: Optional[float] = None
+        # bumped by flush(); a sync that started before it does not cover it
+        self._flushes = 0
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if not BLOOM_ENABLED or self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._rebuild_periodically()),
+            asyncio.create_task(self._sync_periodically()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def might_exist(self, code: str) -> bool:
+        if self._filter is None or self._missed_since is not None:
+            return True
+        # a filter that stopped syncing could be missing codes created elsewhere
+        if time.monotonic() - self._synced_at > BLOOM_SYNC_OVERLAP_SECONDS:
+            return True
+        return code in self._filter
+
+    def add(self, *codes: str) -> None:
+        for bloom in (self._filter, self._building):
+            if bloom is not None:
+                bloom.update(codes)
+
+    def flush(self) -> None:
+        # notifications were missed; the next sync reads back to when they may have started
+        alive_at = InvalidationListener().alive_at
+        if alive_at is None:
+            return
+        self._flushes += 1
+        if self._missed_since is None or alive_at < self._missed_since:
+            self._missed_since = alive_at
+
+    def stats(self) -> dict:
+        if self._filter is None:
+            return {"enabled": BLOOM_ENABLED, "ready": False}
+        return {"enabled": BLOOM_ENABLED, "ready": True, **self._filter.stats()}
+
+    async def rebuild(self) -> None:
+        started = time.monotonic()
+        async with database.SessionLocal() as db:
+            estimate = await self.repository.estimate_count(db)
+            bloom = BloomFilter(
+                max(int(estimate * BLOOM_GROWTH), BLOOM_MIN_CAPACITY), BLOOM_ERROR_RATE
+            )
+            # codes added from now on reach the new filter even if the scan misses them
+            self._building = bloom
+            synced_at = time.monotonic()
+            try:
+                async for codes in self.repository.stream_codes(db, BLOOM_SCAN_BATCH_SIZE):
+                    bloom.update(codes)
+                    # let requests run between batches
+                    await asyncio.sleep(0)
+            finally:
+                self._building = None
+
+        self._filter = bloom
+        self._synced_at = synced_at
+        _logger.info(
+            f"Short code filter built: {bloom.count} codes, {bloom.size_bytes} bytes, "
+            f"{time.monotonic() - started:.1f}s"
+        )
+
+    async def sync(self) -> None:
+        if self._filter is None:
+            return
+        started = time.monotonic()
+        since = datetime.utcnow() - timedelta(
+            seconds=BLOOM_SYNC_OVERLAP_SECONDS + started - self._synced_at
+        )
+        missed_since, flushes = self._missed_since, self._flushes
+        if missed_since is not None:
+            since = min(since, datetime.utcfromtimestamp(missed_since - BLOOM_SYNC_OVERLAP_SECONDS))
+        async with database.SessionLocal() as db:
+            async for codes in self.repository.stream_codes(db, BLOOM_SCAN_BATCH_SIZE, since):
+                self.add(*codes)
+        self._synced_at = started
+        if flushes == self._flushes:
+            self._missed_since = None
+
+    async def _rebuild_periodically(self) -> None:
+        while True:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                _logger.error(f"Building the short code filter failed: {str(e)}")
+            await asyncio.sleep(BLOOM_REBUILD_SECONDS)
+
+    async def _sync_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(BLOOM_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception as e:
+                _logger.error(f"Syncing the short code filter failed: {str(e)}")
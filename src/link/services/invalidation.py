@@ -0,0 +1,135 @@
+import json
+import time
+import asyncio
+from typing import Callable, List, Optional
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.share.logging import Logging
+from src.db.sql_alchemy import Database
+from src.util.singleton import Singleton
+from src.util.env import env_bool
+
+INVALIDATION_ENABLED = env_bool("LINK_INVALIDATION_ENABLED", "true")
+CHANNEL = "link_invalidation"
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 30
+# A silently dropped connection is only noticed when something is sent on it
+KEEPALIVE_SECONDS = 30
+
+database = Database()
+_logger = Logging().get_logger()
+
+
+def _encode(codes: List[str]) -> str:
+    return json.dumps({"codes": codes}, separators=(",", ":"))
+
+
+def _payloads(codes: List[str]) -> List[str]:
+    payloads, batch, size = [], [], len(_encode([]))
+    for code in codes:
+        length = len(json.dumps(code).encode("utf-8")) + 1
+        if batch and size + length > MAX_PAYLOAD_BYTES:
+            payloads.append(_encode(batch))
+            batch, size = [], len(_encode([]))
+        batch.append(code)
+        size += length
+    if batch:
+        payloads.append(_encode(batch))
+    return payloads
+
+
+async def publish_invalidation(db: AsyncSession, codes: List[str]) -> None:
+    """
+    Tell every worker, this one included, to drop ``codes`` from their caches.
+
+    Call it in the transaction of the write, before its commit: Postgres
+    delivers the notification when, and only if, that transaction commits.
+    """
+    if not INVALIDATION_ENABLED or not codes:
+        return
+    for payload in _payloads(codes):
+        await db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+class InvalidationListener(metaclass=Singleton):
+    """
+    Holds one LISTEN connection per worker and applies invalidations.
+
+    Caches register an ``evict`` callback, called with each invalidated
+    short code, and a ``flush`` callback. Events sent while the connection
+    is down are lost, so every cache is flushed whenever the listener
+    (re)connects; ``alive_at`` then still tells when the previous connection
+    was last known to work. Reconnects back off from 1 to 30 seconds.
+    """
+
+    def __init__(self) -> None:
+        self._evict: List[Callable[[str], None]] = []
+        self._flush: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        # wall clock time the connection was last known to be listening
+        self.alive_at: Optional[float] = None
+
+    def subscribe(self, evict: Callable[[str], None], flush: Optional[Callable[[], None]] = None) -> None:
+        self._evict.append(evict)
+        if flush is not None:
+            self._flush.append(flush)
+
+    async def start(self) -> None:
+        if not INVALIDATION_ENABLED or self._task:
+            return
+        self._task = asyncio.create_task(self._listen_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            codes = json.loads(payload)["codes"]
+        except (ValueError, KeyError, TypeError):
+            _logger.error(f"Ignoring malformed invalidation: {payload!r}")
+            return
+        for code in codes:
+            for evict in self._evict:
+                evict(code)
+
+    async def _listen_forever(self) -> None:
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            connection = None
+            try:
+                connection = await database.connect_raw()
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(CHANNEL, self._on_notification)
+
+                # anything published while we were not listening was missed
+                for flush in self._flush:
+                    flush()
+                self.alive_at = time.time()
+                delay = RECONNECT_MIN_SECONDS
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        await connection.fetchval("SELECT 1", timeout=KEEPALIVE_SECONDS)
+                        self.alive_at = time.time()
+                _logger.error("Invalidation listener lost its connection; reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                _logger.error(f"Invalidation listener failed: {str(e)}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    # the connection may be half dead; do not wait on it
+                    connection.terminate()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
@@ -0,0 +1,182 @@
+import os
+import asyncio
+from uuid import UUID
+from typing import List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.models import JobModel
+from src.share.logging import Logging
+from src.db.sql_alchemy import Database
+from src.util.singleton import Singleton
+from src.util.exceptions import NotFoundError, RateLimitError
+from src.link.services.link_service import LinkService
+from src.link.repositories.job_repository import JobRepository
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 1000))
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("JOB_RESULT_TTL_SECONDS", 3600))
+JOB_PURGE_INTERVAL_SECONDS = 60
+# A running job whose worker has not reported for this long is run again
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 120))
+JOB_HEARTBEAT_SECONDS = JOB_STALE_SECONDS / 4
+
+database = Database()
+_logger = Logging().get_logger()
+
+
+class JobService(metaclass=Singleton):
+    """
+    Runs large process-text and bulk workloads in the background.
+
+    Jobs are stored in Postgres, so any worker can answer a status poll, and
+    executed by a bounded pool of asyncio tasks in the process that accepted
+    them. A job is claimed atomically before it runs, so re-enqueueing
+    pending jobs never runs one twice.
+
+    A running job is kept alive by a heartbeat on updated_at. Jobs whose
+    worker died (no heartbeat for JOB_STALE_SECONDS) are put back to
+    pending, and pending jobs left waiting that long, for example in the
+    queue of a dead worker, are picked up by any worker with room.
+    """
+
+    def __init__(self) -> None:
+        self.repository = JobRepository()
+        self.link_service = LinkService()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+        self._tasks: List[asyncio.Task] = []
+        # submits between their queue-full check and their put
+        self._reserved = 0
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        async with database.SessionLocal() as db:
+            await self.repository.reset_stale(db, self._stale_before())
+            self._enqueue(await self.repository.list_pending_ids(db, JOB_QUEUE_SIZE))
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(JOB_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._housekeeping()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _free_slots(self) -> int:
+        return self._queue.maxsize - self._queue.qsize() - self._reserved
+
+    def _enqueue(self, job_ids: List[UUID]) -> None:
+        for job_id in job_ids[:max(self._free_slots(), 0)]:
+            self._queue.put_nowait(job_id)
+
+    @staticmethod
+    def _stale_before() -> datetime:
+        return datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+
+    async def submit(self, db: AsyncSession, user_id: str, kind: str, payload: dict) -> JobModel:
+        if self._free_slots() <= 0:
+            raise RateLimitError("Job queue is full; please try again later")
+
+        job = JobModel(
+            user_id=UUID(user_id),
+            kind=kind,
+            status="pending",
+            payload=payload,
+            expires_at=datetime.utcnow() + timedelta(seconds=JOB_RESULT_TTL_SECONDS),
+        )
+        # the slot is held across the insert, so concurrent submits cannot overfill the queue
+        self._reserved += 1
+        try:
+            job = await self.repository.create(db, job)
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get_job(self, db: AsyncSession, job_id: UUID, user_id: str) -> JobModel:
+        job = await self.repository.get_by_id(db, job_id)
+        if not job or str(job.user_id) != user_id:
+            raise NotFoundError("Job not found")
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _logger.error(f"Job {job_id} could not be recorded: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: UUID) -> None:
+        async with database.SessionLocal() as db:
+            job = await self.repository.claim(db, job_id)
+            if not job:
+                return
+
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await self._execute(db, job.kind, job.payload, str(job.user_id))
+                new_values = {"status": "succeeded", "result": result}
+            except Exception as e:
+                await db.rollback()
+                _logger.error(f"Job {job_id} failed: {str(e)}")
+                new_values = {"status": "failed", "error": str(e)}
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+
+            new_values["expires_at"] = datetime.utcnow() + timedelta(seconds=JOB_RESULT_TTL_SECONDS)
+            await self.repository.finish(db, job_id, new_values)
+
+    async def _execute(self, db: AsyncSession, kind: str, payload: dict, user_id: str) -> Optional[dict]:
+        if kind == "process-text":
+            documents = []
+            for text in payload["documents"]:
+                processed_text, shortened_links = await self.link_service.process_text(
+                    db, text, payload["base_url"], user_id
+                )
+                documents.append({
+                    "processed_text": processed_text,
+                    "shortened_links": shortened_links,
+                })
+            return {"documents": documents}
+
+        if kind == "bulk":
+            items = await self.link_service.create_links_bulk(
+                db,
+                [(item["original_url"], item.get("preferred_code")) for item in payload["items"]],
+                user_id,
+            )
+            return {"items": items}
+
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    async def _heartbeat(self, job_id: UUID) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                async with database.SessionLocal() as db:
+                    await self.repository.touch(db, job_id)
+            except Exception as e:
+                _logger.error(f"Job {job_id} heartbeat failed: {str(e)}")
+
+    async def _housekeeping(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_PURGE_INTERVAL_SECONDS)
+            try:
+                async with database.SessionLocal() as db:
+                    await self.repository.delete_expired(db)
+                    stale_before = self._stale_before()
+                    await self.repository.reset_stale(db, stale_before)
+                    if self._free_slots() > 0:
+                        self._enqueue(await self.repository.list_pending_ids(
+                            db, self._free_slots(), waiting_since=stale_before
+                        ))
+            except Exception as e:
+                _logger.error(f"Job housekeeping failed: {str(e)}")
@@ -1,40 +1,333 @@
-import random
-import string
-from typing import List, Optional
+import os
+import json
+import base64
+import asyncio
+from uuid import UUID
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.db.models import LinkModel
-from src.link.repositories.link_repository import LinkRepository
+from src.share.cache import TTLCache
+from src.share.logging import Logging
+from src.link.utils.short_code import encode_id
+from src.link.utils.redirect import derived_link_values, resolve_destination
+from src.link.utils.url_extractor import extract_url_spans_async, rewrite_spans
+from src.link.services.code_filter import CodeFilter
+from src.link.services.invalidation import InvalidationListener, publish_invalidation
+from src.link.services.shared_redirects import SharedRedirects
+from src.link.services.click_counter import CLICKS_HOUR_RETENTION_DAYS
+from src.util.exceptions import NotFoundError
+from src.util.env import env_bool
+from src.link.repositories.link_repository import EXPORT_COLUMNS, LinkRepository, pin_code
+from src.link.repositories.click_repository import ClickRepository
 
+_logger = Logging().get_logger()
 
-def _generate_code(length: int = 7) -> str:
-    alphabet = string.ascii_letters + string.digits
-    return ''.join(random.choices(alphabet, k=length))
+# Generated codes only collide with custom or legacy codes, so a couple of retries is plenty
+MAX_CODE_ATTEMPTS = 5
+
+# Reuse the existing link when the same destination is shortened again with a generated code
+DEDUP_ENABLED = env_bool("LINK_DEDUP_ENABLED", "false")
+
+# Field names of the rows yielded by export_links
+EXPORT_FIELDS = tuple(column.key for column in EXPORT_COLUMNS)
+
+# Bucket length of each click stats interval, and the range returned when none is given
+STATS_INTERVALS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+STATS_DEFAULT_RANGES = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+STATS_MAX_BUCKETS = int(os.environ.get("LINK_STATS_MAX_BUCKETS", 2000))
+
+# Process-wide cache of short code -> (destination url, redirect status)
+redirect_cache: TTLCache[Tuple[str, int]] = TTLCache(
+    max_size=int(os.environ.get("LINK_CACHE_MAX_SIZE", 10000)),
+    ttl=float(os.environ.get("LINK_CACHE_TTL_SECONDS", 300)),
+)
+
+
+class _IdPool:
+    """
+    Link ids reserved from the database sequence in blocks, so generating a
+    short code normally costs no round trip at all.
+    """
+
+    def __init__(self, block_size: int) -> None:
+        self.block_size = block_size
+        self._ids: deque = deque()
+        self._lock = asyncio.Lock()
+
+    async def take(self, db: AsyncSession, repository: LinkRepository, count: int = 1) -> List[int]:
+        # large batches are reserved directly instead of draining the pool
+        if count >= self.block_size:
+            return await repository.reserve_ids(db, count)
+
+        async with self._lock:
+            if len(self._ids) < count:
+                self._ids.extend(await repository.reserve_ids(db, self.block_size))
+            return [self._ids.popleft() for _ in range(count)]
+
+
+_id_pool = _IdPool(block_size=int(os.environ.get("LINK_ID_BLOCK_SIZE", 100)))
+
+# Membership filter of all short codes; lets redirects of unknown codes skip the database
+code_filter = CodeFilter()
+
+# Creates, updates and deletes in any worker evict the affected codes here.
+# The next lookups of those codes read the primary, so a lagging replica
+# cannot put the old redirect back. Codes are also added to the filter, so a
+# code created or renamed elsewhere is found right away
+InvalidationListener().subscribe(pin_code)
+InvalidationListener().subscribe(redirect_cache.delete, redirect_cache.clear)
+InvalidationListener().subscribe(code_filter.add, code_filter.flush)
+
+# Host-wide table of recent redirects shared by all workers, when enabled
+shared_redirects = SharedRedirects()
+InvalidationListener().subscribe(shared_redirects.evict, shared_redirects.flush)
+
+
+def _owner(user_id: Optional[str]) -> Optional[UUID]:
+    return UUID(user_id) if user_id else None
+
+
+def _to_utc(moment: datetime) -> datetime:
+    # buckets are naive UTC, like every other timestamp in the database
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _bucket_start(moment: datetime, interval: str) -> datetime:
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if interval == "day" else moment
+
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    return last_id
 
 
 class LinkService:
     def __init__(self) -> None:
         self.repository = LinkRepository()
+        self.clicks = ClickRepository()
 
     async def create_link(
         self,
         db: AsyncSession,
         original_url: str,
         preferred_code: Optional[str] = None,
+        user_id: Optional[str] = None,
     ) -> LinkModel:
-        # ensure unique short_code
-        code = preferred_code or _generate_code()
-        # retry a few times if collision
-        for _ in range(10):
-            exists = await self.repository.get_by_code(db, code)
-            if not exists:
-                break
-            code = _generate_code()
-        if await self.repository.get_by_code(db, code):
-            raise ValueError("Could not generate unique short code; please try again")
-
-        link = LinkModel(original_url=original_url, short_code=code)
-        return await self.repository.create(db, link)
+        owner = _owner(user_id)
+        derived = derived_link_values(original_url)
+        if preferred_code:
+            link = await self.repository.create(
+                db,
+                {
+                    "original_url": original_url,
+                    "short_code": preferred_code,
+                    "user_id": owner,
+                    **derived,
+                },
+            )
+            if not link:
+                raise ValueError("Short code already in use")
+            return await self._commit_created(db, link)
+
+        if DEDUP_ENABLED:
+            existing = await self.repository.get_by_url_hash(db, derived["url_hash"], owner)
+            if existing:
+                return existing
+
+        # generated codes are derived from the id, so they need no existence probe
+        for _ in range(MAX_CODE_ATTEMPTS):
+            link_id, = await _id_pool.take(db, self.repository)
+            link = await self.repository.create(
+                db,
+                {
+                    "id": link_id,
+                    "original_url": original_url,
+                    "short_code": encode_id(link_id),
+                    "user_id": owner,
+                    **derived,
+                },
+            )
+            if link:
+                return await self._commit_created(db, link)
+        raise ValueError("Could not generate unique short code; please try again")
+
+    async def _commit_created(self, db: AsyncSession, link: LinkModel) -> LinkModel:
+        # other workers add the code to their filters when the notification arrives
+        await publish_invalidation(db, [link.short_code])
+        await db.commit()
+        code_filter.add(link.short_code)
+        return link
+
+    async def create_links_bulk(
+        self,
+        db: AsyncSession,
+        items: List[Tuple[str, Optional[str]]],
+        user_id: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Create links for (original_url, preferred_code) pairs in one transaction.
+
+        Returns one result per item in input order; items that could not be
+        created carry an ``error`` instead of an id and short code.
+        """
+        results: List[dict] = [
+            {"original_url": url, "id": None, "short_code": None, "error": None}
+            for url, _ in items
+        ]
+        owner = _owner(user_id)
+        derived = [{"user_id": owner, **derived_link_values(url)} for url, _ in items]
+        digests = [values["url_hash"] for values in derived]
+
+        custom_rows: Dict[str, int] = {}
+        generated: List[int] = []
+        for index, (_, code) in enumerate(items):
+            if not code:
+                generated.append(index)
+            elif code in custom_rows:
+                results[index]["error"] = "Short code already in use"
+            else:
+                custom_rows[code] = index
+
+        # items repeating a destination share the result of its first occurrence
+        duplicates: Dict[int, int] = {}
+        if DEDUP_ENABLED and generated:
+            existing = await self.repository.get_codes_by_url_hashes(
+                db, list({digests[index] for index in generated}), owner
+            )
+            first_by_digest: Dict[bytes, int] = {}
+            remaining = []
+            for index in generated:
+                digest = digests[index]
+                if digest in existing:
+                    results[index]["id"], results[index]["short_code"] = existing[digest]
+                elif digest in first_by_digest:
+                    duplicates[index] = first_by_digest[digest]
+                else:
+                    first_by_digest[digest] = index
+                    remaining.append(index)
+            generated = remaining
+
+        created: List[str] = []
+        pending = {
+            code: (
+                index,
+                {"original_url": items[index][0], "short_code": code, **derived[index]},
+            )
+            for code, index in custom_rows.items()
+        }
+        for _ in range(MAX_CODE_ATTEMPTS):
+            if generated:
+                ids = await _id_pool.take(db, self.repository, len(generated))
+                retry = []
+                for index, link_id in zip(generated, ids):
+                    code = encode_id(link_id)
+                    if code in custom_rows:
+                        retry.append(index)
+                        continue
+                    pending[code] = (
+                        index,
+                        {
+                            "id": link_id,
+                            "original_url": items[index][0],
+                            "short_code": code,
+                            **derived[index],
+                        },
+                    )
+                generated = retry
+            if not pending:
+                if not generated:
+                    break
+                continue
+
+            inserted = await self.repository.create_many(db, [row for _, row in pending.values()])
+            # adding codes that end up rolled back only costs a false positive
+            code_filter.add(*(code for _, code in inserted))
+            for link_id, code in inserted:
+                created.append(code)
+                index, _ = pending.pop(code)
+                results[index]["id"] = link_id
+                results[index]["short_code"] = code
+
+            # whatever was not inserted lost its code to an existing row
+            for code, (index, row) in pending.items():
+                if "id" in row:
+                    generated.append(index)
+                else:
+                    results[index]["error"] = "Short code already in use"
+            pending = {}
+
+        for index in generated:
+            results[index]["error"] = "Could not generate unique short code; please try again"
+        for index, first in duplicates.items():
+            for key in ("id", "short_code", "error"):
+                results[index][key] = results[first][key]
+
+        await publish_invalidation(db, created)
+        await db.commit()
+        return results
+
+    async def shorten_urls(
+        self, db: AsyncSession, urls: List[str], user_id: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Shorten a batch of URLs with generated codes in a single transaction.
+
+        Returns a mapping of URL -> short code; URLs that could not be
+        shortened are left out.
+        """
+        results = await self.create_links_bulk(db, [(url, None) for url in urls], user_id)
+        return {
+            result["original_url"]: result["short_code"]
+            for result in results
+            if not result["error"]
+        }
+
+    async def process_text(
+        self, db: AsyncSession, text: str, base_url: str, user_id: Optional[str] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        Shorten every URL found in ``text``.
+
+        Returns the rewritten text and the mapping of original to shortened
+        URLs. URLs that fail to shorten are left as they are.
+        """
+        spans = await extract_url_spans_async(text)
+        if not spans:
+            return text, {}
+
+        # each unique URL is processed once; already shortened links are skipped
+        unique_urls = [url for url in dict.fromkeys(url for url, _, _ in spans) if "acecrm.ca" not in url]
+
+        try:
+            codes = await self.shorten_urls(db, unique_urls, user_id)
+        except Exception as e:
+            # If shortening fails, keep the original text
+            await db.rollback()
+            _logger.error(f"Failed to shorten URLs: {str(e)}")
+            codes = {}
+
+        # Build the shortened URLs and rewrite every occurrence in one pass
+        shortened_links = {
+            url: f"{base_url}/l/{code}" for url, code in codes.items()
+        }
+        return rewrite_spans(text, spans, shortened_links), shortened_links
 
     async def get_link(self, db: AsyncSession, link_id: int) -> LinkModel:
         link = await self.repository.get_by_id(db, link_id)
@@ -48,23 +341,148 @@ class LinkService:
             raise ValueError("Link not found")
         return link
 
-    async def list_links(self, db: AsyncSession) -> List[LinkModel]:
-        return await self.repository.list(db)
+    def cached_redirect(self, code: str) -> Optional[Tuple[str, int]]:
+        """The cached redirect target of ``code``, without touching the database."""
+        target = redirect_cache.get(code)
+        if target is None:
+            target = shared_redirects.get(code)
+        return target
+
+    async def resolve_redirect(self, db: AsyncSession, code: str) -> Optional[Tuple[str, int]]:
+        target = self.cached_redirect(code)
+        if target is not None:
+            return target
+
+        if not code_filter.might_exist(code):
+            return None
+
+        link = await self.repository.get_redirect(db, code)
+        if not link:
+            return None
+        if link.redirect_status is not None:
+            target = (link.destination_url, link.redirect_status)
+        else:
+            # not backfilled yet
+            target = resolve_destination(link.original_url)
+        redirect_cache.set(code, target)
+        return target
+
+    def cache_stats(self) -> dict:
+        return {**redirect_cache.stats(), "code_filter": code_filter.stats()}
+
+    async def list_links(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[LinkModel], Optional[str]]:
+        """
+        One page of the user's links in id order.
+
+        Returns the links and an opaque cursor for the next page, or None
+        when this is the last page.
+        """
+        after_id = _decode_cursor(cursor) if cursor else 0
+        # fetch one extra row to know whether another page exists
+        links = await self.repository.list(db, UUID(user_id), limit + 1, after_id)
+        if len(links) <= limit:
+            return links, None
+        links = links[:limit]
+        return links, _encode_cursor(links[-1].id)
+
+    async def get_click_stats(
+        self,
+        db: AsyncSession,
+        link_id: int,
+        user_id: str,
+        interval: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> dict:
+        """
+        Clicks of a link per ``interval`` ("hour" or "day") in [start, end).
+
+        The range is widened to whole buckets and defaults to the last 24
+        hours or 30 days up to now. Only buckets with clicks are listed.
+        Hourly ranges cannot start more than LINK_CLICKS_HOUR_RETENTION_DAYS
+        ago, as older hour buckets are purged; use days for those.
+        """
+        if interval not in STATS_INTERVALS:
+            raise ValueError(f"interval must be one of: {', '.join(STATS_INTERVALS)}")
+        link = await self.repository.get_by_id(db, link_id)
+        # links created before ownership was recorded are visible to everyone
+        if not link or (link.user_id is not None and str(link.user_id) != user_id):
+            raise NotFoundError("Link not found")
+
+        step = STATS_INTERVALS[interval]
+        end = _to_utc(end) if end else datetime.utcnow()
+        start = _to_utc(start) if start else end - STATS_DEFAULT_RANGES[interval]
+        if end <= start:
+            raise ValueError("end must be after start")
+        start, last = _bucket_start(start, interval), _bucket_start(end, interval)
+        end = last if last == end else last + step
+        if (end - start) / step > STATS_MAX_BUCKETS:
+            raise ValueError(f"The range spans more than {STATS_MAX_BUCKETS} {interval} buckets")
+        if interval == "hour" and start < datetime.utcnow() - timedelta(days=CLICKS_HOUR_RETENTION_DAYS):
+            raise ValueError(
+                f"Hourly clicks are only kept for {CLICKS_HOUR_RETENTION_DAYS} days; use interval=day"
+            )
+
+        series = await self.clicks.series(db, link_id, interval, start, end)
+        return {
+            "link_id": link_id,
+            "interval": interval,
+            "start": start,
+            "end": end,
+            "clicks": sum(clicks for _, clicks in series),
+            "total_clicks": await self.clicks.get_total(db, link_id),
+            "series": [{"bucket": bucket, "clicks": clicks} for bucket, clicks in series],
+        }
+
+    def export_links(
+        self, db: AsyncSession, user_id: str, batch_size: int, include_unowned: bool = False
+    ) -> AsyncIterator[Sequence[tuple]]:
+        """
+        Batches of the user's link rows, in EXPORT_COLUMNS order, for streaming
+        exports. ``include_unowned`` adds the links created before ownership
+        was recorded, which are visible to everyone.
+        """
+        return self.repository.stream_rows(db, UUID(user_id), batch_size, include_unowned)
 
     async def update_link(self, db: AsyncSession, link_id: int, original_url: Optional[str] = None, short_code: Optional[str] = None) -> LinkModel:
         new_values = {}
         if original_url is not None:
             new_values["original_url"] = original_url
+            new_values.update(derived_link_values(original_url))
         if short_code is not None:
-            # ensure unique if changing
-            exists = await self.repository.get_by_code(db, short_code)
-            if exists and exists.id != link_id:
-                raise ValueError("Short code already in use")
             new_values["short_code"] = short_code
-        updated = await self.repository.update(db, link_id, new_values)
-        if not updated:
+        try:
+            result = await self.repository.update(db, link_id, new_values)
+        except IntegrityError:
+            # the unique constraint is the source of truth for short code ownership
+            await db.rollback()
+            raise ValueError("Short code already in use")
+        if not result:
             raise ValueError("Link not found")
+        updated, old_code = result
+        # sent with the commit, so other workers never miss an applied update
+        await publish_invalidation(db, list({old_code, updated.short_code}))
+        await db.commit()
+        # the table may still hold the old redirect until its writer gets the invalidation
+        for code in {old_code, updated.short_code}:
+            redirect_cache.delete(code)
+            shared_redirects.evict(code)
+        # the old code stays in the filter until the next rebuild
+        code_filter.add(updated.short_code)
         return updated
 
     async def delete_link(self, db: AsyncSession, link_id: int) -> None:
-        await self.repository.delete(db, link_id)
+        # deleted codes cannot be removed from the filter; the periodic rebuild sheds them
+        code = await self.repository.delete(db, link_id)
+        if code:
+            await publish_invalidation(db, [code])
+        await db.commit()
+        if code:
+            redirect_cache.delete(code)
+            shared_redirects.evict(code)
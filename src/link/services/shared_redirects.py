@@ -0,0 +1,164 @@
+import os
+import fcntl
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional, Set, Tuple
+
+from src.share.cache import TTLCache
+from src.share.logging import Logging
+from src.db.sql_alchemy import Database
+from src.util.singleton import Singleton
+from src.util.env import env_bool
+from src.share.shared_table import SharedRedirectTable
+from src.link.utils.redirect import resolve_destination
+from src.link.repositories.link_repository import LinkRepository
+from src.link.repositories.click_repository import ClickRepository
+from src.link.services.click_counter import CLICKS_ENABLED
+
+SHM_ENABLED = env_bool("LINK_SHM_ENABLED", "false")
+SHM_PATH = os.environ.get("LINK_SHM_PATH", "/dev/shm/link_shortener_redirects")
+SHM_SLOTS = int(os.environ.get("LINK_SHM_SLOTS", 65536))
+SHM_REFRESH_SECONDS = float(os.environ.get("LINK_SHM_REFRESH_SECONDS", 60))
+# Links are ranked by their clicks over this many hours
+SHM_HOT_HOURS = int(os.environ.get("LINK_SHM_HOT_HOURS", 24))
+# A worker does not read codes it saw invalidated from the table for this
+# long, which covers the writer getting the same invalidation and removing them
+SHM_EVICTED_SECONDS = float(os.environ.get("LINK_SHM_EVICTED_SECONDS", 10))
+# Readers that started before the writer look for the file this often
+SHM_ATTACH_RETRY_SECONDS = 1
+
+database = Database()
+_logger = Logging().get_logger()
+
+
+class SharedRedirects(metaclass=Singleton):
+    """
+    Host-wide table of redirects shared by all workers through SharedRedirectTable.
+
+    Every worker reads it; the one worker holding an exclusive flock on
+    ``<path>.lock`` is the writer. The writer refills the table with the
+    most clicked links of the last LINK_SHM_HOT_HOURS (the most recently
+    written ones when click counting is off) every LINK_SHM_REFRESH_SECONDS,
+    and removes codes as updates and deletes are broadcast; until then,
+    workers that have seen a code invalidated skip the table for it. When
+    broadcasts may have been missed it empties the table and refills it at
+    once. If the writer exits, its lock is released and another worker
+    takes over on its next attempt.
+    Memory is 2 * LINK_SHM_SLOTS * 256 bytes per host whatever the number
+    of workers, and a new worker is warm as soon as it maps the file.
+    """
+
+    def __init__(self) -> None:
+        self.repository = LinkRepository()
+        self.clicks = ClickRepository()
+        # the slot count is part of the name, so a resized table never shrinks a mapped file
+        self.table = SharedRedirectTable(f"{SHM_PATH}.{SHM_SLOTS}", SHM_SLOTS)
+        self._lock_fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        # codes invalidated while a refill was reading from the database
+        self._evicted_during_fill: Optional[Set[str]] = None
+        # codes this worker must not read from the table yet
+        self._evicted: TTLCache[bool] = TTLCache(max_size=SHM_SLOTS, ttl=SHM_EVICTED_SECONDS)
+        # bumped by flush(); a refill that started before it is dropped
+        self._flushes = 0
+        self._refresh_now = asyncio.Event()
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_fd is not None
+
+    async def start(self) -> None:
+        if not SHM_ENABLED or self._task:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.table.close()
+
+    def get(self, code: str) -> Optional[Tuple[str, int]]:
+        if self._evicted.get(code):
+            return None
+        return self.table.get(code)
+
+    def evict(self, code: str) -> None:
+        self._evicted.set(code, True)
+        if not self.is_writer:
+            return
+        self.table.delete(code)
+        if self._evicted_during_fill is not None:
+            self._evicted_during_fill.add(code)
+
+    def flush(self) -> None:
+        # entries may be stale for missed invalidations
+        if not self.is_writer or not self.table.attached:
+            return
+        self._flushes += 1
+        self.table.fill(())
+        self._refresh_now.set()
+
+    def _try_lock(self) -> bool:
+        fd = os.open(f"{self.table.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def refresh(self) -> None:
+        self._evicted_during_fill = set()
+        flushes = self._flushes
+        limit = int(SHM_SLOTS * 0.5)
+        try:
+            async with database.SessionLocal() as db:
+                if CLICKS_ENABLED:
+                    since = datetime.utcnow() - timedelta(hours=SHM_HOT_HOURS)
+                    rows = await self.clicks.hot_redirects(db, since, limit)
+                else:
+                    rows = await self.repository.recent_redirects(db, limit)
+            if flushes != self._flushes:
+                # read before the flush; the refill it asked for follows
+                return
+            entries = (
+                (code, destination_url, redirect_status)
+                if redirect_status is not None
+                # not backfilled yet
+                else (code, *resolve_destination(original_url))
+                for code, original_url, destination_url, redirect_status in rows
+            )
+            stored = self.table.fill(entries, skip=self._evicted_during_fill)
+        finally:
+            self._evicted_during_fill = None
+        _logger.info(f"Shared redirect table refreshed with {stored} links")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self.is_writer and self._try_lock():
+                    self.table.attach(create=True)
+                    _logger.info(f"This worker now writes the shared redirect table {self.table.path}")
+                if self.is_writer:
+                    await self.refresh()
+                elif not self.table.attached:
+                    self.table.attach()
+            except Exception as e:
+                _logger.error(f"Shared redirect table update failed: {str(e)}")
+
+            if self.is_writer:
+                try:
+                    await asyncio.wait_for(self._refresh_now.wait(), SHM_REFRESH_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._refresh_now.clear()
+            elif self.table.attached:
+                await asyncio.sleep(SHM_REFRESH_SECONDS)
+            else:
+                await asyncio.sleep(SHM_ATTACH_RETRY_SECONDS)
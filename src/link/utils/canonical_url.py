@@ -0,0 +1,47 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+# Width of LinkModel.url_hash in bytes
+URL_HASH_SIZE = 16
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a destination so equivalent spellings compare equal.
+
+    URLs without a scheme get ``http://`` (as the redirect does), scheme and
+    host are lowercased, default ports are dropped and an empty path becomes
+    ``/``. Path, query and fragment are kept verbatim.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+def url_hash(url: str) -> bytes:
+    """Fixed width digest of the canonical form of ``url``, used for dedup lookups."""
+    return hashlib.blake2b(
+        canonicalize_url(url).encode("utf-8"), digest_size=URL_HASH_SIZE
+    ).digest()
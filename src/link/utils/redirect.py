@@ -0,0 +1,33 @@
+from http import HTTPStatus
+from typing import Tuple
+
+from src.link.utils.canonical_url import url_hash
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp')
+
+
+def resolve_destination(original_url: str) -> Tuple[str, int]:
+    """
+    Compute where a link redirects to and with which status.
+
+    Done once when a link is written; the result is stored on the link as
+    destination_url and redirect_status.
+    """
+    # Ensure the URL has a scheme
+    if not (original_url.startswith('http://') or original_url.startswith('https://')):
+        original_url = f'http://{original_url}'
+
+    # Use permanent redirect for images, temporary redirect for other URLs
+    is_image = original_url.lower().endswith(IMAGE_EXTENSIONS)
+    redirect_status = HTTPStatus.MOVED_PERMANENTLY if is_image else HTTPStatus.TEMPORARY_REDIRECT
+    return original_url, int(redirect_status)
+
+
+def derived_link_values(original_url: str) -> dict:
+    """Column values of LinkModel that are derived from original_url."""
+    destination_url, redirect_status = resolve_destination(original_url)
+    return {
+        "url_hash": url_hash(original_url),
+        "destination_url": destination_url,
+        "redirect_status": redirect_status,
+    }
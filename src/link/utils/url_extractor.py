@@ -0,0 +1,174 @@
+import os
+import re
+import idna
+import string
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urlextract import URLExtract
+from concurrent.futures import ThreadPoolExecutor
+
+# TLD list shipped with the repo, so the extractor never downloads or refreshes it at runtime
+TLD_FILE = Path(__file__).resolve().parent.parent / "data" / "tlds-alpha-by-domain.txt"
+
+# URLExtract copies the remaining text for every TLD candidate, so large
+# inputs are scanned in whitespace aligned windows. A URL never contains
+# whitespace, which makes the split invisible to the results.
+WINDOW_SIZE = 64 * 1024
+
+OFFLOAD_CHARS = int(os.environ.get("URL_EXTRACT_OFFLOAD_CHARS", 100000))
+WORKERS = int(os.environ.get("URL_EXTRACT_WORKERS", 2))
+
+# URLExtract only stops a URL at ASCII whitespace, so only those are safe split points
+_WHITESPACE_CHARS = frozenset(string.whitespace)
+_WHITESPACE = re.compile("[" + re.escape(string.whitespace) + "]")
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Regex alternation of ``words`` factored into a trie.
+
+    Greedy optional groups keep the longest-match-first behaviour of a plain
+    alternation sorted by length, while letting the engine reject most
+    positions after a single character comparison.
+    """
+    root: dict = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if "" in node else group
+
+    return build(root)
+
+
+class _BundledURLExtract(URLExtract):
+    def _load_cached_tlds(self) -> Set[str]:
+        tlds = set()
+        with open(TLD_FILE, "r") as f:
+            for line in f:
+                tld = line.strip().lower()
+                if not tld or tld[0] == "#":
+                    continue
+                tlds.add("." + tld)
+                tlds.add("." + idna.decode(tld))
+        return tlds
+
+    def _reload_tlds_from_file(self):
+        # same matches as URLExtract's flat alternation, but anchored on the
+        # leading dot and factored into a trie, which is orders of magnitude faster
+        tlds = [tld[1:].lower() for tld in self._load_cached_tlds()]
+        tlds += [tld[1:] for tld in self._ipv4_tld]
+        pattern = r"\." + _trie_pattern(tlds)
+        if self._extract_localhost:
+            pattern += "|localhost"
+        self._tlds_re = re.compile(pattern, flags=re.IGNORECASE)
+
+
+_extractor: Optional[URLExtract] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_extractor() -> URLExtract:
+    global _extractor
+    if _extractor is None:
+        _extractor = _BundledURLExtract(limit=None)
+    return _extractor
+
+
+def warm_up() -> None:
+    """Build the extractor and its TLD regex ahead of the first request."""
+    get_extractor().find_urls("warm up https://example.com")
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _window_end(text: str, start: int) -> int:
+    end = start + WINDOW_SIZE
+    if end >= len(text):
+        return len(text)
+    for i in range(end, start, -1):
+        if text[i] in _WHITESPACE_CHARS:
+            return i
+    match = _WHITESPACE.search(text, end)
+    return match.start() if match else len(text)
+
+
+def last_split_point(text: str) -> int:
+    """
+    Index of the last whitespace character in ``text``, or -1.
+
+    Text before this point can be scanned for URLs independently of whatever
+    follows it, which is what streaming callers need to cut chunks safely.
+    """
+    for i in range(len(text) - 1, -1, -1):
+        if text[i] in _WHITESPACE_CHARS:
+            return i
+    return -1
+
+
+def extract_url_spans(text: str) -> List[Tuple[str, int, int]]:
+    """Extract all URLs from the given text as (url, start, end), in order of appearance."""
+    extractor = get_extractor()
+    spans = []
+    start = 0
+    while start < len(text):
+        end = _window_end(text, start)
+        window = text[start:end] if start or end < len(text) else text
+        for url, (url_start, url_end) in extractor.find_urls(window, get_indices=True):
+            spans.append((url, start + url_start, start + url_end))
+        start = end
+    return spans
+
+
+def extract_urls(text: str) -> List[str]:
+    """Extract all URLs from the given text, in order of appearance."""
+    return [url for url, _, _ in extract_url_spans(text)]
+
+
+async def extract_url_spans_async(text: str) -> List[Tuple[str, int, int]]:
+    """Like extract_url_spans, but large texts are processed off the event loop."""
+    global _executor
+    if len(text) < OFFLOAD_CHARS:
+        return extract_url_spans(text)
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="url-extract")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, extract_url_spans, text)
+
+
+def rewrite_spans(text: str, spans: List[Tuple[str, int, int]], replacements: Dict[str, str]) -> str:
+    """
+    Replace the URL at each span that has a replacement, in a single pass.
+
+    Only the extracted spans are touched, so a URL that is a prefix of
+    another, or a replacement that contains a URL, is never rewritten twice.
+    """
+    parts = []
+    position = 0
+    for url, start, end in spans:
+        replacement = replacements.get(url)
+        if replacement is None:
+            continue
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    if not parts:
+        return text
+    parts.append(text[position:])
+    return "".join(parts)
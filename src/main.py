@@ -12,7 +12,16 @@ from fastapi.responses import JSONResponse, RedirectResponse
 
 from src import api_router
 from src.db.models import init_db
+from src.db.sql_alchemy import Database
 from src.share.logging import Logging
+from src.link.utils import url_extractor
+from src.link.routers import link_router
+from src.link.routers.fast_redirect import PREFIX, FAST_REDIRECT_ENABLED, FastRedirectMiddleware
+from src.link.services.job_service import JobService
+from src.link.services.code_filter import CodeFilter
+from src.link.services.invalidation import InvalidationListener
+from src.link.services.shared_redirects import SharedRedirects
+from src.link.services.click_counter import ClickCounter
 
 load_dotenv()
 _logger = Logging().get_logger()
@@ -45,6 +54,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if FAST_REDIRECT_ENABLED:
+    # added last so it runs first; static GET routes under /l/ stay with the router
+    app.add_middleware(
+        FastRedirectMiddleware,
+        reserved=[
+            route.path[len(PREFIX):]
+            for route in link_router.router.routes
+            if route.path.startswith(PREFIX) and "{" not in route.path and "GET" in route.methods
+        ],
+    )
+
 # Global handler for all exceptions
 @app.exception_handler(HTTPException)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -102,3 +122,21 @@ app.include_router(api_router)
 @app.on_event("startup")
 async def on_startup():
     await init_db()
+    url_extractor.warm_up()
+    await JobService().start()
+    await CodeFilter().start()
+    await InvalidationListener().start()
+    await SharedRedirects().start()
+    await ClickCounter().start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await JobService().stop()
+    await CodeFilter().stop()
+    await InvalidationListener().stop()
+    await SharedRedirects().stop()
+    # flushes the remaining counts, so it goes before the database is disposed
+    await ClickCounter().stop()
+    url_extractor.shutdown()
+    await Database().dispose()
@@ -0,0 +1,169 @@
+import os
+import mmap
+import struct
+import hashlib
+from typing import Iterable, Optional, Set, Tuple
+
+MAGIC = b"LSRT0001"
+# magic, active region, slots per region
+_HEADER = struct.Struct("<8sII")
+HEADER_SIZE = 64
+
+# seq, hash, status, code length, url length; followed by the code and url bytes
+_SLOT = struct.Struct("<IQHBH")
+SLOT_SIZE = 256
+MAX_CODE_BYTES = 32
+_CODE_OFFSET = _SLOT.size
+_URL_OFFSET = _CODE_OFFSET + MAX_CODE_BYTES
+MAX_URL_BYTES = SLOT_SIZE - _URL_OFFSET
+
+MAX_PROBES = 16
+# regions are filled to at most this share of their slots, to keep probe sequences short
+MAX_LOAD = 0.5
+
+
+def _hash(code: bytes) -> int:
+    # 0 marks an empty slot, so real hashes are odd
+    return int.from_bytes(hashlib.blake2b(code, digest_size=8).digest(), "little") | 1
+
+
+class SharedRedirectTable:
+    """
+    Fixed-slot, open-addressing table of short code -> (url, status) in a
+    memory-mapped file, shared by every process on the host.
+
+    The file holds a header and two regions of ``num_slots`` slots of
+    SLOT_SIZE bytes. Readers use the region named in the header; the single
+    writer fills the other one and then switches the header over. Each slot
+    carries a sequence number that is odd while the slot is written, so
+    readers take no lock: a read that overlaps a write sees the sequence
+    change and is reported as a miss. Codes longer than MAX_CODE_BYTES and
+    URLs longer than MAX_URL_BYTES are not stored.
+    """
+
+    def __init__(self, path: str, num_slots: int) -> None:
+        self.path = path
+        self.num_slots = num_slots
+        self.size = HEADER_SIZE + 2 * num_slots * SLOT_SIZE
+        self._mm: Optional[mmap.mmap] = None
+
+    @property
+    def attached(self) -> bool:
+        return self._mm is not None
+
+    def attach(self, create: bool = False) -> bool:
+        """Map the file; the writer passes ``create`` to make or size it."""
+        if self._mm is not None:
+            return True
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        try:
+            fd = os.open(self.path, flags, 0o600)
+        except FileNotFoundError:
+            return False
+        try:
+            if create and os.fstat(fd).st_size != self.size:
+                os.ftruncate(fd, self.size)
+            if os.fstat(fd).st_size != self.size:
+                return False
+            mm = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+        magic, _, num_slots = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            if not create:
+                mm.close()
+                return False
+            _HEADER.pack_into(mm, 0, MAGIC, 0, self.num_slots)
+        elif num_slots != self.num_slots:
+            mm.close()
+            return False
+        self._mm = mm
+        return True
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _region(self, index: int) -> int:
+        return HEADER_SIZE + index * self.num_slots * SLOT_SIZE
+
+    def _active(self) -> int:
+        return _HEADER.unpack_from(self._mm, 0)[1]
+
+    def _find(self, base: int, code: bytes, hashed: int) -> Tuple[Optional[int], int]:
+        """Offset of the slot holding ``code`` (or None) and the sequence number it was read at."""
+        mm = self._mm
+        for probe in range(MAX_PROBES):
+            offset = base + ((hashed + probe) % self.num_slots) * SLOT_SIZE
+            seq, slot_hash, _, code_len, _ = _SLOT.unpack_from(mm, offset)
+            if seq & 1 or slot_hash == 0:
+                return None, seq
+            if slot_hash == hashed and mm[offset + _CODE_OFFSET:offset + _CODE_OFFSET + code_len] == code:
+                return offset, seq
+        return None, 0
+
+    def get(self, code: str) -> Optional[Tuple[str, int]]:
+        if self._mm is None:
+            return None
+        encoded = code.encode("utf-8")
+        offset, seq = self._find(self._region(self._active()), encoded, _hash(encoded))
+        if offset is None:
+            return None
+
+        _, _, status, _, url_len = _SLOT.unpack_from(self._mm, offset)
+        url = self._mm[offset + _URL_OFFSET:offset + _URL_OFFSET + url_len]
+        # a changed sequence number means the slot was rewritten while we read it
+        if _SLOT.unpack_from(self._mm, offset)[0] != seq or status == 0:
+            return None
+        return url.decode("utf-8"), status
+
+    # --- writer side: only the process holding the writer lock calls these ---
+
+    def fill(self, entries: Iterable[Tuple[str, str, int]], skip: Set[str] = frozenset()) -> int:
+        """Replace the contents with (code, url, status) entries; returns how many were stored."""
+        mm = self._mm
+        index = 1 - self._active()
+        base = self._region(index)
+        mm[base:base + self.num_slots * SLOT_SIZE] = bytes(self.num_slots * SLOT_SIZE)
+
+        limit = int(self.num_slots * MAX_LOAD)
+        stored = 0
+        for code, url, status in entries:
+            if stored >= limit:
+                break
+            if code in skip:
+                continue
+            encoded, url_bytes = code.encode("utf-8"), url.encode("utf-8")
+            if len(encoded) > MAX_CODE_BYTES or len(url_bytes) > MAX_URL_BYTES:
+                continue
+            hashed = _hash(encoded)
+            for probe in range(MAX_PROBES):
+                offset = base + ((hashed + probe) % self.num_slots) * SLOT_SIZE
+                slot_hash = _SLOT.unpack_from(mm, offset)[1]
+                if slot_hash == hashed and mm[offset + _CODE_OFFSET:offset + _CODE_OFFSET + len(encoded)] == encoded:
+                    break
+                if slot_hash == 0:
+                    _SLOT.pack_into(mm, offset, 1, hashed, status, len(encoded), len(url_bytes))
+                    mm[offset + _CODE_OFFSET:offset + _CODE_OFFSET + len(encoded)] = encoded
+                    mm[offset + _URL_OFFSET:offset + _URL_OFFSET + len(url_bytes)] = url_bytes
+                    struct.pack_into("<I", mm, offset, 2)
+                    stored += 1
+                    break
+
+        _HEADER.pack_into(mm, 0, MAGIC, index, self.num_slots)
+        return stored
+
+    def delete(self, code: str) -> None:
+        """Mark ``code`` as absent; the slot keeps its hash so probe sequences stay intact."""
+        if self._mm is None:
+            return
+        encoded = code.encode("utf-8")
+        hashed = _hash(encoded)
+        for index in (0, 1):
+            offset, seq = self._find(self._region(index), encoded, hashed)
+            if offset is not None:
+                struct.pack_into("<I", self._mm, offset, seq + 1)
+                struct.pack_into("<H", self._mm, offset + 12, 0)
+                struct.pack_into("<I", self._mm, offset, seq + 2)
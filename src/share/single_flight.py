@@ -0,0 +1,65 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[V]):
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller of do() for a key runs ``fn``; callers arriving while
+    it is in flight wait for that result, or its exception, instead of
+    running their own. Cancelling a waiter only cancels that waiter. When
+    the caller running ``fn`` is cancelled, ``fn`` is cancelled too unless
+    others are waiting on it, in which case it is left to finish first:
+    ``fn`` may use that caller's resources, such as its database session.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[V]]) -> V:
+        call = self._calls.get(key)
+        if call is not None:
+            call.waiters += 1
+            try:
+                return await asyncio.shield(call.task)
+            finally:
+                call.waiters -= 1
+
+        call = _Call(asyncio.ensure_future(fn()))
+        self._calls[key] = call
+        call.task.add_done_callback(lambda _: self._forget(key, call))
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.waiters:
+                # nobody else needs it; later callers start a new call
+                self._forget(key, call)
+                call.task.cancel()
+            await self._wait_uncancellable(call.task)
+            raise
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    @staticmethod
+    async def _wait_uncancellable(task: asyncio.Task) -> None:
+        while not task.done():
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                continue
@@ -1,11 +1,18 @@
 from uuid import UUID
 from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Row, select
 from sqlalchemy.orm import load_only
 
 from src.db.models import UserModel
- 
+from src.db.sql_alchemy import Database
+from src.share.single_flight import SingleFlight
+
+database = Database()
+
+# Concurrent lookups of the same user share one query. They share the row, not
+# an ORM instance, which would stay bound to the session that loaded it
+_user_flights: SingleFlight[Optional[Row]] = SingleFlight()
 
 
 class UserRepository:
@@ -24,15 +31,19 @@ class UserRepository:
             user_id (UUID): The unique identifier of the user.
 
         Returns:
-            Optional[UserModel]: The user if found, otherwise None.
+            Optional[UserModel]: The user if found, otherwise None. It is
+            not attached to any session; only id and username are set.
         """
-        stmt = (
-            select(UserModel)
-            .options(load_only(UserModel.id, UserModel.username))
-            .where(UserModel.id == user_id)
-        )
-        res = await db_session.execute(stmt)
-        return res.scalar_one_or_none()
+        stmt = select(UserModel.id, UserModel.username).where(UserModel.id == user_id)
+        keys = [f"user:{user_id}"]
+
+        async def fetch() -> Optional[Row]:
+            res = await database.read(db_session, stmt, keys)
+            return res.one_or_none()
+
+        row = await _user_flights.do((user_id, database.reads_primary(db_session, keys)), fetch)
+        # every caller gets its own instance
+        return UserModel(id=row.id, username=row.username) if row else None
 
     async def get_all(self, db_session: AsyncSession) -> list[UserModel]:
         """
@@ -62,6 +73,7 @@ class UserRepository:
         db_session.add(user)
         await db_session.commit()
         await db_session.refresh(user)
+        database.pin(f"user:{user.id}")
         return user
 
     async def update(self, db_session: AsyncSession, new_data: dict) -> UserModel:
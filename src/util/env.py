@@ -0,0 +1,6 @@
+import os
+
+
+def env_bool(name: str, default: str) -> bool:
+    """Read a flag from the environment; "1", "true" and "yes" (any case) are true."""
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
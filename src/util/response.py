@@ -2,7 +2,7 @@ from pydantic import BaseModel
 from pydantic.generics import GenericModel
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
-from typing import TypeVar, Generic, Optional, Any
+from typing import TypeVar, Generic, Optional
 
 DataT = TypeVar("DataT")
 MetadataT = TypeVar("MetadataT")
@@ -13,7 +13,7 @@ class GlobalResponse(GenericModel, Generic[DataT, MetadataT]):
     metadata: Optional[MetadataT] = None
 
 
-def global_response(content: dict, metadata: dict = None):
+def global_response(content: dict, metadata: dict = None, status_code: int = 200):
     # Use jsonable_encoder to ensure all objects are JSON serializable
     response_content = {"data": jsonable_encoder(content)}
     if metadata:
@@ -21,7 +21,7 @@ def global_response(content: dict, metadata: dict = None):
     else:
         response_content["metadata"] = {}
 
-    return JSONResponse(content=response_content)
+    return JSONResponse(content=response_content, status_code=status_code)
 
 
 class ExceptionResponse(BaseModel):